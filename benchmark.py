@@ -0,0 +1,369 @@
+"""
+Benchmark for the image hot paths of the editor
+
+It drives ProcessImage.load_image, display_image, apply_selection_mask, suggest_crop, resize_preview and
+download_cropped_image on synthetic images (1 MP to 100 MP, several formats) and reports
+p50/p95 latency, throughput and peak memory as JSON.
+
+    python benchmark.py                                  # all sizes and formats, JSON on stdout
+    python benchmark.py --sizes 1,12 --formats jpg -o new.json
+    python benchmark.py --baseline old.json --threshold 0.15   # exit code 1 on regressions
+
+Without a display the Tk widgets are replaced by stubs (see StubWidget), so the numbers cover the
+NumPy/OpenCV/PIL work but not Tk's own drawing. With a display (or --real-tk) a real window is used.
+
+The startup cases run the editor in fresh interpreters: the import time of image_core and main, the time
+until the window is painted and the whole process; "startup_modules" lists the heavy libraries that were
+already imported at the first paint (it should stay empty, they are loaded when first needed).
+"""
+import os
+import sys
+import json
+import time
+import types
+import argparse
+import tempfile
+import tracemalloc
+import resource
+import struct
+import subprocess
+import tkinter as tk
+
+from image_core import LazyModule
+import main
+
+cv2 = LazyModule("cv2") # Lazy like in the editor, so the startup child does not load them up front
+np = LazyModule("numpy")
+
+CANVAS_SIZE = (1600, 1000) # Size of the (stub) canvas the image is displayed on
+GIGAPIXEL_SIZE = (20000, 9500) # 190 MP, over PIL's decompression bomb limit (about 179 MP)
+HEAVY_MODULES = ("cv2", "numpy", "PIL.Image", "PIL.ImageTk", "asyncio", "multiprocessing")
+
+# Runs in a fresh interpreter: times the imports and building the window up to its first paint
+STARTUP_CHILD = """
+import sys, time, json
+started = time.perf_counter()
+import image_core
+core_imported = time.perf_counter()
+import main
+main_imported = time.perf_counter()
+import benchmark
+window_started = time.perf_counter()
+root = benchmark.create_real_root() if {real_tk} else benchmark.install_stubs()
+app = main.LoadingImage(root)
+root.update()
+painted = time.perf_counter()
+print(json.dumps({{"import_core": core_imported - started, "import_main": main_imported - core_imported,
+                  "first_paint": painted - window_started,
+                  "modules": [name for name in benchmark.HEAVY_MODULES if name in sys.modules]}}))
+"""
+
+
+"""
+Stubs used instead of Tk when there is no display
+"""
+class StubWidget:
+    """Accepts any widget call and ignores it. Canvas items get increasing ids and timers are queued on the root"""
+    root = None
+
+    def __init__(self, *args, **kwargs):
+        self.item_count = 0
+        self.tk = self # For photo.tk.call(...)
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+    def __str__(self):
+        return "stub"
+
+    def winfo_width(self):
+        return CANVAS_SIZE[0]
+
+    def winfo_height(self):
+        return CANVAS_SIZE[1]
+
+    def create_image(self, *args, **kwargs):
+        self.item_count += 1
+        return self.item_count
+
+    create_rectangle = create_image
+    create_text = create_image
+
+    def canvasy(self, y):
+        return float(y)
+
+    def get(self):
+        return 100.0 # Slider value
+
+    def after(self, delay, callback, *args):
+        return StubWidget.root.queue(callback, *args)
+
+    def after_idle(self, callback, *args):
+        return StubWidget.root.queue(callback, *args)
+
+    def after_cancel(self, job):
+        StubWidget.root.jobs.pop(job, None)
+
+
+class StubRoot(StubWidget):
+    """Root window stub that keeps the after() callbacks so the benchmark can run them"""
+    def __init__(self):
+        super().__init__()
+        self.jobs = {}
+        self.next_job = 0
+        StubWidget.root = self
+
+    def queue(self, callback, *args):
+        self.next_job += 1
+        self.jobs[self.next_job] = (callback, args)
+        return self.next_job
+
+    def update(self):
+        """Run the queued callbacks once (callbacks may queue new ones)"""
+        jobs, self.jobs = self.jobs, {}
+        for callback, args in jobs.values():
+            callback(*args)
+
+
+class StubPhotoImage:
+    """Stands in for ImageTk.PhotoImage/tk.PhotoImage, copies the pixels like the real one does"""
+    def __init__(self, image=None, width=0, height=0, **kwargs):
+        self.tk = StubWidget()
+        if image is not None:
+            image.tobytes()
+
+    def paste(self, image):
+        image.tobytes()
+
+    def __str__(self):
+        return "stub_photo"
+
+
+def install_stubs():
+    """Replace the Tk pieces used by main.py with stubs"""
+    stub_tk = types.SimpleNamespace(**{name: getattr(tk, name) for name in dir(tk) if name.isupper()})
+    stub_tk.Canvas = StubWidget
+    stub_tk.PhotoImage = StubPhotoImage
+    stub_tk.messagebox = types.SimpleNamespace(showerror=lambda *args, **kwargs: None,
+                                               askyesno=lambda *args, **kwargs: True) # Re-encode when lossless is not possible
+    main.tk = stub_tk
+    main.ttk = types.SimpleNamespace(Style=StubWidget, Frame=StubWidget, LabelFrame=StubWidget,
+                                     Button=StubWidget, Label=StubWidget, Scale=StubWidget,
+                                     Scrollbar=StubWidget)
+    main.ImageTk = types.SimpleNamespace(PhotoImage=StubPhotoImage)
+    main.messagebox = stub_tk.messagebox
+    return StubRoot()
+
+
+def create_real_root():
+    """Real Tk window (needs a display)"""
+    root = tk.Tk()
+    root.geometry(f"{CANVAS_SIZE[0]}x{CANVAS_SIZE[1]}")
+    root.update()
+    return root
+
+
+"""
+Synthetic images and timing helpers
+"""
+def make_image(megapixels, seed=0):
+    """Gradients with some noise, so the encoders see something close to a photo"""
+    width = int(np.sqrt(megapixels * 1e6 * 4 / 3))
+    height = int(megapixels * 1e6 / width)
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[..., 0] = (x + y) / 2
+    image[..., 1] = x[::-1] * 0.8 + 20
+    image[..., 2] = y * 0.9
+    image += rng.integers(0, 16, size=(height, 1, 3), dtype=np.uint8) # Cheap banding noise
+    return image
+
+
+def make_sparse_bmp(path, width, height):
+    """24-bit BMP whose pixel data is a sparse (black) file, so a gigapixel source is written instantly"""
+    row_bytes = (width * 3 + 3) & ~3
+    with open(path, "wb") as bmp_file:
+        bmp_file.write(b"BM" + struct.pack("<IHHI", 54 + row_bytes * height, 0, 0, 54))
+        bmp_file.write(struct.pack("<IiiHHIIiiII", 40, width, height, 1, 24, 0, row_bytes * height, 2835, 2835, 0, 0))
+        bmp_file.truncate(54 + row_bytes * height)
+
+
+def measure(function, repeat, setup=None, settle=None):
+    """Run function repeat times, returns latencies (s) and the traced peak memory of one extra run (bytes)"""
+    latencies = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        function()
+        if settle is not None:
+            settle()
+        latencies.append(time.perf_counter() - started)
+
+    # Peak memory on a separate run, tracing slows down the timed runs
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    function()
+    if settle is not None:
+        settle()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return latencies, peak
+
+
+def summarize(latencies, peak, megapixels=None):
+    p50 = float(np.percentile(latencies, 50))
+    return {
+        "p50_ms": round(p50 * 1000, 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 3),
+        "throughput_mp_per_s": round(megapixels / p50, 2) if megapixels and p50 > 0 else None,
+        "peak_traced_mb": round(peak / 2 ** 20, 2),
+        "runs": len(latencies)
+    }
+
+
+"""
+Benchmark cases
+"""
+def run_startup(repeat, real_tk, work_dir):
+    """Start the editor in fresh interpreters, returns the startup cases and the heavy modules loaded at first paint"""
+    script = STARTUP_CHILD.format(real_tk=real_tk)
+    environment = dict(os.environ, HOME=work_dir) # The editor creates its thumbnail cache in the home folder
+    phases = {"import_core": [], "import_main": [], "first_paint": [], "process": []}
+    modules = set()
+    for _ in range(repeat):
+        started = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), env=environment).stdout
+        phases["process"].append(time.perf_counter() - started) # Interpreter start up to exit
+        child = json.loads(output.strip().splitlines()[-1])
+        modules.update(child.pop("modules"))
+        for phase, seconds in child.items():
+            phases[phase].append(seconds)
+    return {f"startup/{phase}": summarize(latencies, 0) for phase, latencies in phases.items()}, sorted(modules)
+
+
+def run_benchmarks(sizes, formats, repeat, real_tk):
+    work_dir = tempfile.mkdtemp(prefix="image_editor_bench_")
+    os.environ["HOME"] = work_dir # Keep the undo journals of the benchmark out of the real home folder
+    results, startup_modules = run_startup(repeat, real_tk, work_dir)
+    root = create_real_root() if real_tk else install_stubs()
+    app = main.LoadingImage(root)
+
+    def wait_for_tasks():
+        # Pump the event loop until the background tasks are done
+        while app.tasks.tasks or app.prefetch_tasks.tasks:
+            root.update()
+            time.sleep(0.001)
+        root.update()
+
+    for megapixels in sizes:
+        image = make_image(megapixels)
+        source_megapixels = image.shape[0] * image.shape[1] / 1e6
+        for image_format in formats:
+            path = os.path.join(work_dir, f"source_{megapixels}mp.{image_format}")
+            cv2.imwrite(path, image)
+            name = f"{image_format}/{megapixels}MP"
+
+            processor = main.ProcessImage()
+            results[f"load_image/{name}"] = summarize(*measure(lambda: processor.load_image(path), repeat), source_megapixels)
+            results[f"load_image_preview/{name}"] = summarize(*measure(
+                lambda: processor.load_image(path, max_size=CANVAS_SIZE), repeat), source_megapixels)
+
+            # Show the image in the editor (as after a background load)
+            app.on_image_loaded(app.decode_for_display(path, CANVAS_SIZE), 0.0)
+            results[f"display_image/{name}"] = summarize(*measure(app.display_image, repeat), source_megapixels)
+
+            # Selection mask with a different rectangle every run
+            rng = np.random.default_rng(1)
+            def select():
+                app.start_x, app.start_y = (int(value) for value in rng.integers(0, 400, 2))
+                app.end_x, app.end_y = (int(value) for value in rng.integers(600, 1000, 2))
+            results[f"apply_selection_mask/{name}"] = summarize(*measure(app.apply_selection_mask, repeat, setup=select), source_megapixels)
+
+            # Crop suggestion on the loaded preview (should stay far below 50 ms at every size)
+            results[f"suggest_crop/{name}"] = summarize(*measure(app.suggest_crop, repeat), source_megapixels)
+
+            # Slider scrub (fast passes) and the final LANCZOS pass
+            scales = iter(range(10, 10 ** 6))
+            results[f"resize_preview/{name}"] = summarize(*measure(
+                lambda: app.resize_preview(next(scales)), repeat, settle=root.update), source_megapixels)
+
+            # Full resolution crop export (decode, crop and encode happen in the background task)
+            output_path = os.path.join(work_dir, f"crop.{image_format}")
+            main.filedialog.asksaveasfilename = lambda **kwargs: output_path
+            results[f"download_cropped_image/{name}"] = summarize(*measure(
+                app.download_cropped_image, repeat, settle=wait_for_tasks), source_megapixels)
+            os.remove(path)
+
+    # A source over PIL's decompression bomb limit has to take the tiled path, never a whole decode
+    path = os.path.join(work_dir, "gigapixel.bmp")
+    make_sparse_bmp(path, *GIGAPIXEL_SIZE)
+    processor = main.ProcessImage()
+    def load_tiled():
+        if not processor.load_image(path, max_size=CANVAS_SIZE) or processor.tiled is None:
+            raise RuntimeError(f"{path} was not opened as a tiled image: {processor.last_error}")
+    megapixels = GIGAPIXEL_SIZE[0] * GIGAPIXEL_SIZE[1] / 1e6
+    results["load_image_preview/bmp_tiled/190MP"] = summarize(*measure(load_tiled, repeat), megapixels)
+    results["crop_from_source/bmp_tiled/190MP"] = summarize(*measure(
+        lambda: processor.crop_from_source(9000, 4000, 11000, 5500), repeat), megapixels)
+    os.remove(path)
+
+    return {
+        "canvas": list(CANVAS_SIZE),
+        "real_tk": real_tk,
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "startup_modules": startup_modules,
+        "results": results
+    }
+
+
+def compare(report, baseline, threshold):
+    """Return the cases whose p50 latency got slower than the baseline by more than threshold"""
+    regressions = []
+    for case, result in report["results"].items():
+        old = baseline.get("results", {}).get(case)
+        if old and old["p50_ms"] > 0 and result["p50_ms"] > old["p50_ms"] * (1 + threshold):
+            regressions.append({"case": case, "baseline_p50_ms": old["p50_ms"], "p50_ms": result["p50_ms"],
+                                "change": round(result["p50_ms"] / old["p50_ms"] - 1, 3)})
+    return regressions
+
+
+def main_benchmark(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the image hot paths of the editor")
+    parser.add_argument("--sizes", default="1,12,50,100", help="image sizes in megapixels, comma separated")
+    parser.add_argument("--formats", default="jpg,png,bmp", help="file formats, comma separated")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per case")
+    parser.add_argument("--real-tk", action="store_true", default=bool(os.environ.get("DISPLAY")),
+                        help="use a real Tk window (default when a display is available)")
+    parser.add_argument("-o", "--output", help="write the JSON report to this file")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed p50 slowdown before a case is a regression")
+    args = parser.parse_args(argv)
+
+    sizes = [float(size) if "." in size else int(size) for size in args.sizes.split(",")]
+    report = run_benchmarks(sizes, args.formats.split(","), args.repeat, args.real_tk)
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            report["regressions"] = compare(report, json.load(baseline_file), args.threshold)
+        for regression in report["regressions"]:
+            print(f"REGRESSION {regression['case']}: {regression['baseline_p50_ms']} ms -> {regression['p50_ms']} ms",
+                  file=sys.stderr)
+        exit_code = 1 if report["regressions"] else 0
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(text)
+    else:
+        print(text)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main_benchmark())
@@ -0,0 +1,1614 @@
+"""
+Processing core of the image editor: loading, cropping, resizing and encoding images, the batch,
+template and rendition exports and the local crop service. It has no GUI dependency, errors are
+raised as exceptions (or passed to a callback) so scripts and services can use it without Tk.
+
+OpenCV, NumPy and PIL are only imported when they are first used (see LazyModule), so importing
+this module is cheap and a window or a command line tool can start before they are loaded.
+"""
+import os
+import io
+import sys
+import time
+import importlib
+import urllib.parse
+import csv
+import json
+from collections import OrderedDict
+import struct
+import sqlite3 # on-disk thumbnail cache
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class LazyModule:
+    """
+    Stands in for a module that is slow to import. The module is imported on the first attribute access,
+    after that its names are copied onto the proxy so later lookups cost the same as on the module itself.
+    """
+    def __init__(self, name):
+        self.__dict__["_lazy_name"] = name
+
+    def __getattr__(self, attribute):
+        # Only called for names not copied yet, i.e. before the import (or for names the module creates later)
+        module = importlib.import_module(self._lazy_name)
+        self.__dict__.update(vars(module))
+        return getattr(module, attribute)
+
+    def __repr__(self):
+        return f"<lazy module {self._lazy_name}>"
+
+
+argparse = LazyModule("argparse") # command line options for the batch mode
+asyncio = LazyModule("asyncio") # local crop service
+subprocess = LazyModule("subprocess") # jpegtran for lossless JPEG crops
+process_pool = LazyModule("concurrent.futures.process") # ProcessPoolExecutor (multiprocessing is slow to import)
+Image = LazyModule("PIL.Image") # PIL (Python Imaging Library) is used for image processing
+cv2 = LazyModule("cv2") # OpenCV library for image processing
+np = LazyModule("numpy")
+HEADER_LOCK = threading.Lock() # Guards the decompression bomb limit while open_header lifts it
+
+
+def open_header(path):
+    """
+    Open an image with PIL to read its header (size, format, raw tile layout). PIL refuses images over
+    MAX_IMAGE_PIXELS as decompression bombs, but no pixels are decoded here, so the check is turned off
+    for the open (gigapixel scans are exactly the files the tiled reader is for).
+    """
+    module = sys.modules[Image.__name__] # The real PIL.Image, the limit is one of its globals
+    with HEADER_LOCK:
+        limit = module.MAX_IMAGE_PIXELS
+        module.MAX_IMAGE_PIXELS = None
+        try:
+            return Image.open(path)
+        finally:
+            module.MAX_IMAGE_PIXELS = limit
+
+
+def preload_modules():
+    """Import the lazily loaded libraries now, e.g. on a thread once the window is shown"""
+    for module in (np, cv2, Image):
+        getattr(module, "__name__")
+
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".webp") # Files used by batch mode and browsing
+
+class ProcessImage:
+    """
+    This class handles the image loading and processing. 
+    It provides functionality to load the chosen image using openCV and also handles colour conversion from BGR to RGB
+
+    For the editor a preview can be decoded instead of the full image: JPEG decoders can scale down by 2, 4 or 8
+    while decoding (cv2.IMREAD_REDUCED_COLOR_*), which is much faster and needs a fraction of the memory.
+    The full image is only decoded when a full resolution operation (like saving a crop) needs it.
+
+    Very large uncompressed rasters (TIFF, BMP, PPM) are never decoded whole: they are opened as a TiledImage,
+    current_image holds a downscaled overview and crops are read from the tiles they overlap.
+    """
+    # imread flags for each reduction factor (names, OpenCV is imported on first use)
+    REDUCED_FLAGS = {
+        1: "IMREAD_COLOR",
+        2: "IMREAD_REDUCED_COLOR_2",
+        4: "IMREAD_REDUCED_COLOR_4",
+        8: "IMREAD_REDUCED_COLOR_8"
+    }
+    TILED_MIN_PIXELS = 64 * 10 ** 6 # Previews of uncompressed images from this size on are read from tiles
+
+    def __init__ (self, on_error=None):
+        self.current_image = None
+        self.current_image_path = None
+        self.on_error = on_error # Called with the message when loading fails (the editor shows it in a message box)
+        self.last_error = None
+        self.reduction = 1 # current_image is the source scaled down by this factor
+        self.full_size = None # (width, height) of the full resolution image
+        self.tiled = None # TiledImage of a very large uncompressed image
+
+    def load_image(self, image_path, max_size=None):
+        """Load an image using OpenCV. With max_size=(width, height) only a reduced preview at least that big is decoded."""
+        try:
+            reduction = 1
+            full_size = None
+            if max_size is not None:
+                header = self.read_image_header(image_path)
+                # Only JPEG decoders scale while decoding, other formats would be decoded in full and resized afterwards
+                if header is not None and header[2] == "JPEG":
+                    full_size = header[:2]
+                    reduction = self.choose_reduction(full_size, max_size)
+                elif header is not None and header[0] * header[1] >= self.TILED_MIN_PIXELS and self.open_tiled(image_path):
+                    # Too big to decode whole, show an overview read from the tiles
+                    reduction = max(min(self.tiled.width // max_size[0], self.tiled.height // max_size[1]), 1)
+                    self.current_image = self.tiled.overview(reduction)
+                    self.reduction = reduction
+                    return True
+
+            image = cv2.imread(image_path, getattr(cv2, self.REDUCED_FLAGS[reduction]))
+            if image is None:
+                raise ValueError("Failed to load image")
+
+            # Convert from BGR to RGB in place, without a second full size array
+            cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image)
+            self.current_image = image
+            self.current_image_path = image_path
+            self.reduction = reduction
+            self.full_size = full_size if reduction > 1 else (image.shape[1], image.shape[0])
+            self.tiled = None
+            return True
+
+        except Exception as e:
+            self.last_error = str(e)
+            if self.on_error is not None:
+                self.on_error(self.last_error)
+            return False
+
+    def open_tiled(self, image_path):
+        """Open an uncompressed image for reading regions from its tiles, False for other images"""
+        tiled = TiledImage.open(image_path)
+        if tiled is None:
+            return False
+        self.tiled = tiled
+        self.current_image = None
+        self.current_image_path = image_path
+        self.full_size = (tiled.width, tiled.height)
+        self.reduction = 1
+        return True
+
+    def read_image_header(self, image_path):
+        """Read (width, height, format) of an image from its header without decoding the pixels"""
+        try:
+            with open_header(image_path) as image:
+                width, height = image.size
+                # OpenCV applies the EXIF rotation, so a rotated photo has its sides swapped
+                # (only read for JPEG, PIL decodes a whole PNG to find its EXIF chunk)
+                if image.format == "JPEG" and image.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+                    width, height = height, width
+                return width, height, image.format
+        except Exception:
+            return None # Unknown to PIL, decode at full size
+
+    def choose_reduction(self, full_size, max_size):
+        """Pick the largest decoder reduction (1, 2, 4 or 8) that still covers max_size"""
+        reduction = 1
+        for factor in (2, 4, 8):
+            if full_size[0] // factor >= max_size[0] and full_size[1] // factor >= max_size[1]:
+                reduction = factor
+        return reduction
+
+    def is_full_resolution(self):
+        """True when current_image holds every pixel of the source"""
+        return self.reduction == 1
+
+    def get_current_image(self):
+        """Return the currently loaded image."""
+        return self.current_image
+
+    def region_reader(self):
+        """Return crop(x1, y1, x2, y2) for taking many crops of the full resolution image, decoding it at most once."""
+        if self.tiled is not None:
+            return lambda x1, y1, x2, y2: self.tiled.read_region(x1, y1, x2, y2, cache=False)[0]
+        image = self.full_image()
+        return lambda x1, y1, x2, y2: image[y1:y2, x1:x2]
+
+    def full_image(self):
+        """Return the full resolution image without replacing the loaded one (safe to call from a worker thread)."""
+        if self.current_image is not None and self.is_full_resolution():
+            return self.current_image
+        # Only a preview is loaded, decode the full image just for the caller
+        source = ProcessImage()
+        if not source.load_image(self.current_image_path):
+            raise ValueError(source.last_error or "Failed to read the source image")
+        return source.current_image
+
+    def crop_from_source(self, x1, y1, x2, y2):
+        """
+        Return the region (x1, y1, x2, y2) of the full resolution image in source pixels, without replacing
+        the loaded image (safe to call from a worker thread).
+        """
+        if self.tiled is not None:
+            return self.tiled.read_region(x1, y1, x2, y2, cache=False)[0] # Only the overlapping tiles are read
+        image = self.full_image()
+        if image is self.current_image:
+            return image[y1:y2, x1:x2]
+        return image[y1:y2, x1:x2].copy() # Copy so the full image can be freed
+
+
+"""
+Lossless JPEG crops
+
+A JPEG can be cropped without decoding the pixels by keeping the DCT blocks inside the crop, as long as
+the top left corner of the crop sits on the MCU grid (8 or 16 pixels, depending on the chroma subsampling).
+The crop is snapped outwards to that grid and jpegtran (libjpeg-turbo / IJG, an optional external tool)
+copies the blocks. No quality is lost and the pixels are never decoded, so it is fast even for 40 MP photos.
+"""
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def read_jpeg_mcu_size(path):
+    """Return the (width, height) of a JPEG's MCU from the sampling factors of its SOF marker"""
+    with open(path, "rb") as jpeg_file:
+        if jpeg_file.read(2) != b"\xff\xd8":
+            raise ValueError("Not a JPEG file")
+        while True:
+            marker = jpeg_file.read(2)
+            if len(marker) < 2 or marker[0] != 0xFF:
+                raise ValueError("No frame header found")
+            if marker[1] == 0xFF:
+                jpeg_file.seek(-1, os.SEEK_CUR) # Fill byte
+                continue
+            length = struct.unpack(">H", jpeg_file.read(2))[0]
+            if marker[1] in JPEG_SOF_MARKERS:
+                header = jpeg_file.read(length - 2)
+                components = header[5]
+                factors = [header[7 + 3 * index] for index in range(components)] # High nibble h, low nibble v
+                if components == 1:
+                    return 8, 8 # A single component is not interleaved, its MCU is one block
+                return 8 * max(factor >> 4 for factor in factors), 8 * max(factor & 0x0F for factor in factors)
+            jpeg_file.seek(length - 2, os.SEEK_CUR)
+
+
+def snap_to_mcu(box, mcu_size):
+    """Move the top left corner of a crop box up and left onto the MCU grid (the other edges stay)"""
+    x1, y1, x2, y2 = box
+    return x1 - x1 % mcu_size[0], y1 - y1 % mcu_size[1], x2, y2
+
+
+def plan_lossless_jpeg_crop(source_path, box):
+    """Check that a crop of a JPEG can be done losslessly, returns the snapped box or raises ValueError"""
+    if shutil.which("jpegtran") is None:
+        raise ValueError("Lossless JPEG crops need jpegtran (libjpeg-turbo), which was not found")
+    with open_header(source_path) as image:
+        if image.format != "JPEG":
+            raise ValueError("The source is not a JPEG")
+        if image.getexif().get(0x0112, 1) not in (0, 1):
+            # The box is in the rotated image, the blocks are stored unrotated
+            raise ValueError("The photo has an EXIF rotation")
+    return snap_to_mcu(box, read_jpeg_mcu_size(source_path))
+
+
+def lossless_jpeg_crop(source_path, output_path, box):
+    """Crop a JPEG without re-encoding it, returns the box that was written (snapped to the MCU grid)"""
+    x1, y1, x2, y2 = plan_lossless_jpeg_crop(source_path, box)
+    temporary_path = output_path + ".tmp"
+    result = subprocess.run(["jpegtran", "-copy", "all", "-crop", f"{x2 - x1}x{y2 - y1}+{x1}+{y1}",
+                             "-outfile", temporary_path, source_path], capture_output=True, text=True)
+    if result.returncode != 0:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise ValueError(f"jpegtran failed: {result.stderr.strip()}")
+    os.replace(temporary_path, output_path) # Never leave a half written crop behind
+    return x1, y1, x2, y2
+
+
+class DisplayMapping:
+    """
+    Records how the source image is placed on the canvas (scale factor and x/y offsets)
+    so a selection drawn on the canvas can be mapped back to the pixels of the source image.
+    """
+    def __init__(self, scale, x_offset, y_offset, source_width, source_height, view_x=None, view_y=None):
+        self.scale = scale
+        self.x_offset = x_offset # Canvas position of the source origin (negative when zoomed/panned)
+        self.y_offset = y_offset
+        self.source_width = source_width
+        self.source_height = source_height
+        # Canvas position of the displayed bitmap, which only covers the visible part of the image
+        self.view_x = x_offset if view_x is None else view_x
+        self.view_y = y_offset if view_y is None else view_y
+
+    def canvas_to_source(self, x, y):
+        """Convert a canvas point to (floating point) source coordinates"""
+        return (x - self.x_offset) / self.scale, (y - self.y_offset) / self.scale
+
+    def source_to_canvas(self, x, y):
+        """Convert a source point to canvas coordinates"""
+        return round(x * self.scale + self.x_offset), round(y * self.scale + self.y_offset)
+
+    def selection_to_source(self, x1, y1, x2, y2):
+        """Map a canvas selection to a sorted source rectangle clamped to the image bounds"""
+        x1, x2 = sorted([x1, x2])
+        y1, y2 = sorted([y1, y2])
+        sx1, sy1 = self.canvas_to_source(x1, y1)
+        sx2, sy2 = self.canvas_to_source(x2, y2)
+
+        # Round outwards so the export never loses a row or column that was visible in the selection
+        sx1 = min(max(int(np.floor(sx1)), 0), self.source_width)
+        sy1 = min(max(int(np.floor(sy1)), 0), self.source_height)
+        sx2 = min(max(int(np.ceil(sx2)), 0), self.source_width)
+        sy2 = min(max(int(np.ceil(sy2)), 0), self.source_height)
+        return sx1, sy1, sx2, sy2
+
+    def selection_to_display(self, x1, y1, x2, y2, display_width, display_height):
+        """Map a canvas selection to a sorted rectangle inside the displayed (resized) image"""
+        x1, x2 = sorted([x1, x2])
+        y1, y2 = sorted([y1, y2])
+        x1 = min(max(x1 - self.view_x, 0), display_width)
+        x2 = min(max(x2 - self.view_x, 0), display_width)
+        y1 = min(max(y1 - self.view_y, 0), display_height)
+        y2 = min(max(y2 - self.view_y, 0), display_height)
+        return x1, y1, x2, y2
+
+
+class ImagePyramid:
+    """
+    Multi-resolution copies of the source image, each level half the size of the previous one (cv2.pyrDown).
+    It is built once at load time, so zooming, panning and resizing only resample the visible part of the nearest level.
+    """
+    def __init__(self, image, min_size=256, full_size=None, base_factor=1.0):
+        self.levels = [image] # Level 0 is the loaded image itself (not a copy)
+        while max(self.levels[-1].shape[:2]) > min_size:
+            self.levels.append(cv2.pyrDown(self.levels[-1]))
+        # Size of the source image, level 0 may be a reduced preview of it (base_factor < 1)
+        self.width, self.height = full_size or (image.shape[1], image.shape[0])
+        self.base_factor = base_factor
+
+    def level_factor(self, level):
+        """Size of a level relative to the source image"""
+        return self.base_factor * 0.5 ** level
+
+    def has_resolution_for(self, scale):
+        """False when the scale needs more pixels than level 0 holds"""
+        return scale <= self.base_factor
+
+    def choose_level(self, scale):
+        """Return the smallest level that still has at least the resolution needed for the scale"""
+        level = 0
+        while level + 1 < len(self.levels) and self.level_factor(level + 1) >= scale:
+            level += 1
+        return level
+
+    def render(self, scale, x_offset, y_offset, canvas_width, canvas_height, out=None):
+        """
+        Resample the part of the image that is visible on the canvas. Returns (image, left, top).
+        The view is written into out when it has the right size, so redraws reuse one display buffer.
+        """
+        # Visible rectangle on the canvas
+        left, top = max(x_offset, 0), max(y_offset, 0)
+        right = min(x_offset + round(self.width * scale), canvas_width)
+        bottom = min(y_offset + round(self.height * scale), canvas_height)
+        if right <= left or bottom <= top:
+            return None, left, top
+
+        level = self.choose_level(scale)
+        source = self.levels[level]
+        ratio = scale / self.level_factor(level) # Canvas pixels per pixel of the chosen level
+
+        # Visible part of the level, with a pixel of margin for the interpolation
+        lx1 = max(int((left - x_offset) / ratio) - 1, 0)
+        ly1 = max(int((top - y_offset) / ratio) - 1, 0)
+        lx2 = min(int(np.ceil((right - x_offset) / ratio)) + 1, source.shape[1])
+        ly2 = min(int(np.ceil((bottom - y_offset) / ratio)) + 1, source.shape[0])
+        region = source[ly1:ly2, lx1:lx2]
+
+        # Affine transform from the pixel centres of the region to the pixel centres of the view
+        tx = (lx1 + 0.5) * ratio + x_offset - left - 0.5
+        ty = (ly1 + 0.5) * ratio + y_offset - top - 0.5
+        matrix = np.float32([[ratio, 0, tx], [0, ratio, ty]])
+        interpolation = cv2.INTER_NEAREST if ratio >= 2 else cv2.INTER_LINEAR # Sharp pixels when zoomed in
+        shape = (bottom - top, right - left) + source.shape[2:]
+        if out is None or out.shape != shape or out.dtype != source.dtype:
+            out = np.empty(shape, dtype=source.dtype)
+        view = cv2.warpAffine(region, matrix, (right - left, bottom - top), dst=out, flags=interpolation,
+                              borderMode=cv2.BORDER_REPLICATE)
+        return view, left, top
+
+
+def subtract_rect(a, b):
+    """Return the parts of rectangle a that are not covered by rectangle b (at most four strips)"""
+    ax1, ay1, ax2, ay2 = a
+    bx1, by1, bx2, by2 = b
+    if bx1 >= ax2 or bx2 <= ax1 or by1 >= ay2 or by2 <= ay1:
+        return [a] # No overlap, all of a is uncovered
+    strips = []
+    if by1 > ay1:
+        strips.append((ax1, ay1, ax2, by1)) # Strip above b
+    if by2 < ay2:
+        strips.append((ax1, by2, ax2, ay2)) # Strip below b
+    top, bottom = max(ay1, by1), min(ay2, by2)
+    if bx1 > ax1:
+        strips.append((ax1, top, bx1, bottom)) # Strip left of b
+    if bx2 < ax2:
+        strips.append((bx2, top, ax2, bottom)) # Strip right of b
+    return strips
+
+
+class RegionIndex:
+    """
+    Uniform grid over the source image for hit testing many crop regions. Every region is listed in the
+    cells its box covers, so a lookup only checks the few regions near the point instead of all of them.
+    """
+    def __init__(self, width, height, cells=64):
+        self.cell_size = max(max(width, height) / cells, 1.0) # Source pixels per cell
+        self.cells = {} # (column, row) -> set of region ids
+        self.boxes = {} # region id -> (x1, y1, x2, y2)
+
+    def cell_keys(self, x1, y1, x2, y2):
+        """Keys of the cells a box touches"""
+        size = self.cell_size
+        for column in range(int(min(x1, x2) // size), int(max(x1, x2) // size) + 1):
+            for row in range(int(min(y1, y2) // size), int(max(y1, y2) // size) + 1):
+                yield column, row
+
+    def insert(self, region_id, box):
+        self.boxes[region_id] = box
+        for key in self.cell_keys(*box):
+            self.cells.setdefault(key, set()).add(region_id)
+
+    def remove(self, region_id):
+        box = self.boxes.pop(region_id, None)
+        if box is None:
+            return
+        for key in self.cell_keys(*box):
+            cell = self.cells.get(key)
+            if cell is not None:
+                cell.discard(region_id)
+                if not cell:
+                    del self.cells[key]
+
+    def update(self, region_id, box):
+        self.remove(region_id)
+        self.insert(region_id, box)
+
+    def query_box(self, x1, y1, x2, y2):
+        """Ids of the regions whose box overlaps (x1, y1, x2, y2)"""
+        found = set()
+        for key in self.cell_keys(x1, y1, x2, y2):
+            for region_id in self.cells.get(key, ()):
+                bx1, by1, bx2, by2 = self.boxes[region_id]
+                if min(bx1, bx2) < x2 and max(bx1, bx2) > x1 and min(by1, by2) < y2 and max(by1, by2) > y1:
+                    found.add(region_id)
+        return found
+
+    def query(self, x, y, tolerance=0.0):
+        """Ids of the regions whose box, grown by tolerance, contains (x, y)"""
+        found = set()
+        for key in self.cell_keys(x - tolerance, y - tolerance, x + tolerance, y + tolerance):
+            for region_id in self.cells.get(key, ()):
+                x1, y1, x2, y2 = self.boxes[region_id]
+                if min(x1, x2) - tolerance <= x <= max(x1, x2) + tolerance \
+                        and min(y1, y2) - tolerance <= y <= max(y1, y2) + tolerance:
+                    found.add(region_id)
+        return found
+
+
+class TiledImage:
+    """
+    Region of interest reader for images too big to decode whole (stitched panoramas, microscopy scans).
+    Works with uncompressed rasters: TIFF strips or tiles, BMP and PPM. The file is memory-mapped and every
+    raw strip or tile listed in PIL's tile descriptors becomes an array view of the mapping, so reading a
+    region only touches the bytes of that region. The view is assembled from a grid of tiles kept in a
+    bounded LRU cache (panning reuses them), crops are copied straight from the file.
+    """
+    TILE_SIZE = 512 # Pixels per side of a cached tile
+
+    # PIL raw mode -> (bytes per pixel, channels to take for RGB)
+    RAW_LAYOUTS = {
+        "RGB": (3, slice(None)),
+        "BGR": (3, slice(None, None, -1)),
+        "RGBX": (4, slice(0, 3)),
+        "RGBA": (4, slice(0, 3)),
+        "BGRX": (4, slice(2, None, -1)),
+        "BGRA": (4, slice(2, None, -1)),
+        "L": (1, slice(0, 1)) # Repeated into the three channels
+    }
+
+    def __init__(self, path, cache_mb=256):
+        with open_header(path) as image:
+            self.width, self.height = image.size
+            tiles = list(image.tile)
+        if not tiles:
+            raise ValueError("No raster data")
+        self.file_map = np.memmap(path, dtype=np.uint8, mode="r")
+        self.blocks = [] # (x1, y1, x2, y2, rows of the block, channels)
+        self.block_index = RegionIndex(self.width, self.height)
+        for codec, (x1, y1, x2, y2), offset, args in tiles:
+            args = (args,) if isinstance(args, str) else tuple(args)
+            rawmode = args[0]
+            stride = args[1] if len(args) > 1 else 0
+            orientation = args[2] if len(args) > 2 else 1
+            if codec != "raw" or rawmode not in self.RAW_LAYOUTS:
+                raise ValueError(f"Compressed or unsupported raster ({codec}, {rawmode})")
+            pixel_bytes, channels = self.RAW_LAYOUTS[rawmode]
+            width, height = x2 - x1, y2 - y1
+            stride = stride or width * pixel_bytes
+            if offset + stride * height > self.file_map.size:
+                raise ValueError("Truncated image file")
+            rows = self.file_map[offset:offset + stride * height].reshape(height, stride)
+            rows = rows[:, :width * pixel_bytes].reshape(height, width, pixel_bytes)
+            if orientation < 0:
+                rows = rows[::-1] # Bottom-up rows (BMP)
+            self.block_index.insert(len(self.blocks), (x1, y1, x2, y2))
+            self.blocks.append((x1, y1, x2, y2, rows, channels))
+
+        self.cache = OrderedDict() # (column, row, step) -> tile
+        self.cache_budget = cache_mb * 2 ** 20
+        self.cache_size = 0
+        self.lock = threading.Lock() # The view and background crops read at the same time
+
+    @staticmethod
+    def open(path):
+        """Return a TiledImage for the file, or None when it is not an uncompressed raster"""
+        try:
+            return TiledImage(path)
+        except (OSError, ValueError, SyntaxError):
+            return None
+
+    def align(self, x1, y1, step):
+        """Round a region origin down to the sample grid of a step"""
+        return x1 - x1 % step, y1 - y1 % step
+
+    def copy_region(self, x1, y1, x2, y2, step=1):
+        """Read every step-th pixel of (x1, y1, x2, y2) from the file, (x1, y1) must be aligned to step"""
+        out = np.empty(((y2 - y1 + step - 1) // step, (x2 - x1 + step - 1) // step, 3), dtype=np.uint8)
+        for block in self.block_index.query_box(x1, y1, x2, y2):
+            bx1, by1, bx2, by2, rows, channels = self.blocks[block]
+            # First sample inside the block on the step grid of the region
+            sx1 = x1 + -(-(max(bx1, x1) - x1) // step) * step
+            sy1 = y1 + -(-(max(by1, y1) - y1) // step) * step
+            sx2, sy2 = min(bx2, x2), min(by2, y2)
+            if sx2 <= sx1 or sy2 <= sy1:
+                continue
+            samples = rows[sy1 - by1:sy2 - by1:step, sx1 - bx1:sx2 - bx1:step, channels]
+            ox, oy = (sx1 - x1) // step, (sy1 - y1) // step
+            out[oy:oy + samples.shape[0], ox:ox + samples.shape[1]] = samples
+        return out
+
+    def tile(self, column, row, step):
+        """A cached tile of the step grid (TILE_SIZE samples per side)"""
+        key = (column, row, step)
+        with self.lock:
+            tile = self.cache.get(key)
+            if tile is not None:
+                self.cache.move_to_end(key)
+                return tile
+        span = self.TILE_SIZE * step
+        x1, y1 = column * span, row * span
+        tile = self.copy_region(x1, y1, min(x1 + span, self.width), min(y1 + span, self.height), step)
+        with self.lock:
+            self.cache[key] = tile
+            self.cache_size += tile.nbytes
+            while self.cache_size > self.cache_budget and len(self.cache) > 1:
+                _, dropped = self.cache.popitem(last=False)
+                self.cache_size -= dropped.nbytes
+        return tile
+
+    def read_region(self, x1, y1, x2, y2, step=1, cache=True):
+        """
+        Return (samples, x1, y1): every step-th pixel of the region, with the origin rounded down to the step.
+        With cache=False the region is copied straight from the file without going through the tile cache.
+        """
+        x1, y1 = self.align(max(int(x1), 0), max(int(y1), 0), step)
+        x2, y2 = min(int(np.ceil(x2)), self.width), min(int(np.ceil(y2)), self.height)
+        if x2 <= x1 or y2 <= y1:
+            return np.empty((0, 0, 3), dtype=np.uint8), x1, y1
+        if not cache:
+            return self.copy_region(x1, y1, x2, y2, step), x1, y1
+
+        out = np.empty(((y2 - y1 + step - 1) // step, (x2 - x1 + step - 1) // step, 3), dtype=np.uint8)
+        size = self.TILE_SIZE
+        for row in range(y1 // step // size, (y2 - 1) // step // size + 1):
+            for column in range(x1 // step // size, (x2 - 1) // step // size + 1):
+                tile = self.tile(column, row, step)
+                # Overlap of the tile and the region, in samples
+                tx1, ty1 = column * size, row * size
+                ox1, oy1 = max(tx1, x1 // step), max(ty1, y1 // step)
+                ox2 = min(tx1 + tile.shape[1], (x2 + step - 1) // step)
+                oy2 = min(ty1 + tile.shape[0], (y2 + step - 1) // step)
+                out[oy1 - y1 // step:oy2 - y1 // step, ox1 - x1 // step:ox2 - x1 // step] = \
+                    tile[oy1 - ty1:oy2 - ty1, ox1 - tx1:ox2 - tx1]
+        return out, x1, y1
+
+    def overview(self, reduction):
+        """The whole image scaled down by reduction, read in bands so memory stays small"""
+        out_width, out_height = max(self.width // reduction, 1), max(self.height // reduction, 1)
+        out = np.empty((out_height, out_width, 3), dtype=np.uint8)
+        step = max(reduction // 4, 1) # Subsample while reading, INTER_AREA averages the rest
+        band = 64 # Output rows per band
+        for top in range(0, out_height, band):
+            bottom = min(top + band, out_height)
+            samples, _, _ = self.read_region(0, top * self.height // out_height, self.width,
+                                             bottom * self.height // out_height, step, cache=False)
+            cv2.resize(samples, (out_width, bottom - top), dst=out[top:bottom], interpolation=cv2.INTER_AREA)
+        return out
+
+    def render(self, scale, x_offset, y_offset, canvas_width, canvas_height, out=None):
+        """Same as ImagePyramid.render, but reads the visible part from the tiles at the needed resolution"""
+        left, top = max(x_offset, 0), max(y_offset, 0)
+        right = min(x_offset + round(self.width * scale), canvas_width)
+        bottom = min(y_offset + round(self.height * scale), canvas_height)
+        if right <= left or bottom <= top:
+            return None, left, top
+
+        step = max(int(1 / scale), 1) # Every step-th pixel still has the resolution for the scale
+        margin = step # One sample of margin for the interpolation
+        region, region_x, region_y = self.read_region((left - x_offset) / scale - margin, (top - y_offset) / scale - margin,
+                                                      (right - x_offset) / scale + margin, (bottom - y_offset) / scale + margin, step)
+        ratio = scale * step # Canvas pixels per sample
+        tx = (region_x + 0.5 * step) * scale + x_offset - left - 0.5
+        ty = (region_y + 0.5 * step) * scale + y_offset - top - 0.5
+        matrix = np.float32([[ratio, 0, tx], [0, ratio, ty]])
+        interpolation = cv2.INTER_NEAREST if ratio >= 2 else cv2.INTER_LINEAR
+        shape = (bottom - top, right - left, 3)
+        if out is None or out.shape != shape:
+            out = np.empty(shape, dtype=np.uint8)
+        view = cv2.warpAffine(region, matrix, (right - left, bottom - top), dst=out, flags=interpolation,
+                              borderMode=cv2.BORDER_REPLICATE)
+        return view, left, top
+
+
+class ImageCache:
+    """
+    LRU cache of decoded images for browsing a folder. Every entry holds the loaded ProcessImage and its
+    ImagePyramid (the display sized versions), keyed by path and checked against the file's modification time.
+    The least recently used entries are dropped once the cache goes over its memory budget.
+    """
+    def __init__(self, budget_mb=1024):
+        self.budget = budget_mb * 2 ** 20 # bytes
+        self.entries = OrderedDict() # path -> (mtime, processor, pyramid, size in bytes)
+        self.size = 0
+
+    def get(self, path):
+        """Return (processor, pyramid) for a path, or None when it is not cached or the file changed (pyramid may be None)"""
+        entry = self.entries.get(path)
+        if entry is None:
+            return None
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime != entry[0]:
+            self.remove(path) # The file changed on disk
+            return None
+        self.entries.move_to_end(path) # Most recently used
+        return entry[1], entry[2]
+
+    def put(self, path, processor, pyramid):
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return
+        self.remove(path)
+        if pyramid is not None:
+            size = sum(level.nbytes for level in pyramid.levels) # Level 0 is the decoded image itself
+        else:
+            size = processor.current_image.nbytes if processor.current_image is not None else 0
+        self.entries[path] = (mtime, processor, pyramid, size)
+        self.size += size
+        # Drop the least recently used images, but always keep the newest one
+        while self.size > self.budget and len(self.entries) > 1:
+            self.remove(next(iter(self.entries)))
+
+    def remove(self, path):
+        entry = self.entries.pop(path, None)
+        if entry is not None:
+            self.size -= entry[3]
+
+    def __contains__(self, path):
+        return path in self.entries
+
+
+def make_thumbnail(image_path, size):
+    """Decode an image at reduced resolution and return it as JPEG bytes fitting in size x size (None on errors)"""
+    processor = ProcessImage()
+    if not processor.load_image(image_path, max_size=(size, size)):
+        return None
+    image = processor.current_image
+    height, width = image.shape[:2]
+    scale = size / max(width, height)
+    if scale < 1:
+        image = cv2.resize(image, (max(int(round(width * scale)), 1), max(int(round(height * scale)), 1)),
+                           interpolation=cv2.INTER_AREA)
+    data = io.BytesIO()
+    Image.fromarray(image).save(data, "JPEG", quality=85)
+    return data.getvalue()
+
+
+class ThumbnailCache:
+    """
+    Thumbnails of browsed folders in a single SQLite file (~/.image_editor/thumbnails.sqlite) as small JPEGs,
+    keyed by path and checked against the file's modification time and size, so a folder that was seen
+    before shows its thumbnails without decoding anything. Safe to use from several threads.
+    """
+    def __init__(self, path=None):
+        self.path = path or os.path.join(os.path.expanduser("~"), ".image_editor", "thumbnails.sqlite")
+        self.lock = threading.Lock()
+        self.connection = None
+
+    def connect(self):
+        """Open the database on first use"""
+        if self.connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL") # Readers are not blocked by a writer
+            self.connection.execute("CREATE TABLE IF NOT EXISTS thumbnails "
+                                    "(path TEXT PRIMARY KEY, mtime_ns INTEGER, file_size INTEGER, size INTEGER, data BLOB)")
+        return self.connection
+
+    def get_many(self, entries, size):
+        """Look up (path, mtime_ns, file_size) entries, returns path -> JPEG bytes for the ones still valid"""
+        found = {}
+        expected = {path: (mtime, file_size) for path, mtime, file_size in entries}
+        paths = list(expected)
+        with self.lock:
+            connection = self.connect()
+            for start in range(0, len(paths), 500): # SQLite limits the number of query parameters
+                chunk = paths[start:start + 500]
+                rows = connection.execute(
+                    f"SELECT path, mtime_ns, file_size, data FROM thumbnails WHERE size = ? AND path IN ({','.join('?' * len(chunk))})",
+                    [size] + chunk)
+                for path, mtime, file_size, data in rows:
+                    if expected[path] == (mtime, file_size):
+                        found[path] = data
+        return found
+
+    def put_many(self, rows, size):
+        """Store (path, mtime_ns, file_size, JPEG bytes) rows in one transaction"""
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                connection.executemany("INSERT OR REPLACE INTO thumbnails VALUES (?, ?, ?, ?, ?)",
+                                       [(path, mtime, file_size, size, data) for path, mtime, file_size, data in rows])
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+
+"""
+Crop suggestions
+
+The analysis runs on a small grey copy of the image (at most ANALYSIS_SIZE pixels on the long side), so it
+takes a few milliseconds whatever the source resolution and can run for every file of a batch:
+
+    python main.py batch scans -o cropped --suggest
+    python main.py batch shots -o square --suggest --aspect 1:1
+
+1. Border trim: rows and columns at the edges that are one flat colour (scanner bed, letterbox bars,
+   white margins) are dropped.
+2. Edge density: the gradient magnitude, blurred so it covers the subject and not only its outline.
+3. Best window: for window sizes from half to the whole trimmed image, with the requested aspect ratio,
+   the detail inside every position is read from an integral image (four lookups per position, all
+   positions at once). The score is the share of the detail inside minus a share of the area, so the
+   window only grows while it gains more detail than area.
+"""
+ANALYSIS_SIZE = 256 # Long side of the analysis copy in pixels
+WINDOW_SCALES = 11 # Window sizes tried between half and the whole trimmed image
+
+
+def parse_aspect(text):
+    """Parse an aspect ratio "16:9", "4/3" or "1.5" into width / height"""
+    for separator in (":", "/", "x"):
+        if separator in text:
+            width, height = (float(value) for value in text.split(separator, 1))
+            break
+    else:
+        width, height = float(text), 1.0
+    if width <= 0 or height <= 0:
+        raise ValueError(f"Invalid aspect ratio '{text}'")
+    return width / height
+
+
+def analysis_image(image, size=ANALYSIS_SIZE):
+    """Grey copy of an RGB image with at most size pixels on the long side"""
+    height, width = image.shape[:2]
+    scale = min(size / max(width, height), 1.0)
+    # Take every step-th pixel first, so INTER_AREA only averages a small array and the cost does not grow
+    # with the source resolution
+    step = max(int(1 / scale) // 2, 1)
+    small = np.ascontiguousarray(image[::step, ::step])
+    target = (max(int(round(width * scale)), 1), max(int(round(height * scale)), 1))
+    if (small.shape[1], small.shape[0]) != target:
+        small = cv2.resize(small, target, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_RGB2GRAY) if small.ndim == 3 else small
+
+
+def trim_borders(grey, tolerance=10, coverage=0.98):
+    """Return the box (x1, y1, x2, y2) left after removing the flat coloured rows and columns at every edge"""
+    height, width = grey.shape
+    signed = grey.astype(np.int16)
+
+    def flat_lines(lines, colour):
+        # Number of leading lines (rows of lines) that are almost all the edge colour
+        flat = (np.abs(lines - colour) <= tolerance).mean(axis=1) >= coverage
+        if flat.all():
+            return len(flat)
+        count = int(np.argmin(flat))
+        # The first line after a border mixes border and content (it was averaged down), drop it as well
+        return count + 1 if count else 0
+
+    top = flat_lines(signed, np.median(signed[0]))
+    bottom = height - flat_lines(signed[::-1], np.median(signed[-1]))
+    left = flat_lines(signed.T, np.median(signed[:, 0]))
+    right = width - flat_lines(signed.T[::-1], np.median(signed[:, -1]))
+    if right - left < 2 or bottom - top < 2:
+        return 0, 0, width, height # The whole image is flat, nothing to trim to
+    return left, top, right, bottom
+
+
+def edge_density(grey):
+    """Gradient magnitude, blurred over about a fiftieth of the image so detail counts for its neighbourhood"""
+    gradient_x = cv2.Sobel(grey, cv2.CV_32F, 1, 0, ksize=3)
+    gradient_y = cv2.Sobel(grey, cv2.CV_32F, 0, 1, ksize=3)
+    energy = cv2.magnitude(gradient_x, gradient_y)
+    return cv2.GaussianBlur(energy, (0, 0), max(grey.shape) / 50)
+
+
+def best_window(energy, aspect, tightness=0.5):
+    """
+    Return the window (x1, y1, x2, y2) of energy with the given aspect ratio (width / height) that scores best:
+    share of the energy inside minus tightness times the share of the area
+    """
+    height, width = energy.shape
+    integral = cv2.integral(energy, sdepth=cv2.CV_64F) # (height + 1, width + 1), integral[y, x] = sum above and left
+    total = integral[-1, -1]
+    # Largest window with the aspect ratio that fits
+    full_width = min(width, height * aspect)
+    full_height = full_width / aspect
+    best = None
+    for scale in np.linspace(0.5, 1.0, WINDOW_SCALES):
+        window_width = max(int(round(full_width * scale)), 1)
+        window_height = max(int(round(full_height * scale)), 1)
+        # Energy inside the window at every position, from four shifted views of the integral image
+        sums = (integral[window_height:, window_width:] - integral[:-window_height, window_width:]
+                - integral[window_height:, :-window_width] + integral[:-window_height, :-window_width])
+        if total > 0:
+            scores = sums / total - tightness * (window_width * window_height) / (width * height)
+            y, x = np.unravel_index(int(np.argmax(scores)), scores.shape)
+            score = scores[y, x]
+        else:
+            # No detail at all, keep the largest window in the centre
+            y, x = (height - window_height) // 2, (width - window_width) // 2
+            score = scale
+        if best is None or score > best[0]:
+            best = (score, (int(x), int(y), int(x) + window_width, int(y) + window_height))
+    return best[1]
+
+
+def suggest_crop(image, aspect=None, source_size=None, tightness=0.5):
+    """
+    Suggest a crop of an RGB image: borders trimmed, then the best window for the aspect ratio
+    (width / height, None keeps the shape of the trimmed image). source_size=(width, height) maps the box to
+    the full resolution image when image is a preview of it. Returns (x1, y1, x2, y2) in source pixels.
+    """
+    source_width, source_height = source_size or (image.shape[1], image.shape[0])
+    grey = analysis_image(image)
+    x1, y1, x2, y2 = trim_borders(grey)
+    if aspect is None:
+        aspect = (x2 - x1) / (y2 - y1)
+    wx1, wy1, wx2, wy2 = best_window(edge_density(grey[y1:y2, x1:x2]), aspect, tightness)
+
+    # Back to source pixels, the height follows from the width so the aspect ratio is exact
+    scale_x, scale_y = source_width / grey.shape[1], source_height / grey.shape[0]
+    width = min((wx2 - wx1) * scale_x, source_width, source_height * aspect)
+    # At least one pixel per side, an extreme aspect ratio cannot be met exactly on a small image
+    width = min(max(int(round(width)), 1), source_width)
+    height = min(max(int(round(width / aspect)), 1), source_height)
+    left = int(round(min(max((x1 + wx1) * scale_x, 0), source_width - width)))
+    top = int(round(min(max((y1 + wy1) * scale_y, 0), source_height - height)))
+    return left, top, left + width, top + height
+
+
+def suggest_source_crop(processor, aspect=None):
+    """Suggested crop of the image loaded in a ProcessImage, in full resolution pixels"""
+    image = processor.current_image
+    if image is None:
+        # Tiled image without an overview, sample every step-th pixel straight from the file
+        step = max(max(processor.full_size) // ANALYSIS_SIZE, 1)
+        image = processor.tiled.read_region(0, 0, *processor.full_size, step=step, cache=False)[0]
+    return suggest_crop(image, aspect, source_size=processor.full_size)
+
+
+"""
+Headless batch cropping
+
+These functions crop whole folders of images from the command line without opening a window:
+
+    python main.py batch images_for_cropping -o cropped --box 100,50,900,650
+    python main.py batch images_for_cropping -o cropped --relative 0.1,0.1,0.9,0.9
+    python main.py batch -o cropped --manifest crops.csv
+    python main.py batch photos -o cropped --box 100,50,900,650 --lossless   # JPEGs without re-encoding
+
+Decode, crop and encode run in a process pool. Only a bounded number of files are in flight at once,
+and a file that fails is reported without stopping the rest of the batch.
+"""
+
+
+def parse_box(text):
+    """Parse "x1,y1,x2,y2" into a tuple of four numbers"""
+    values = [float(value) for value in text.replace(" ", "").split(",")]
+    if len(values) != 4:
+        raise ValueError(f"Expected x1,y1,x2,y2 but got '{text}'")
+    return tuple(values)
+
+
+def resolve_crop_box(spec, width, height):
+    """Turn a crop spec ("pixels" or "relative", (x1, y1, x2, y2)) into a pixel box clamped to the image"""
+    units, (x1, y1, x2, y2) = spec
+    if units == "relative":
+        x1, x2 = x1 * width, x2 * width
+        y1, y2 = y1 * height, y2 * height
+    elif units != "pixels":
+        raise ValueError(f"Unknown crop units '{units}'")
+    x1, x2 = sorted([min(max(int(round(x1)), 0), width), min(max(int(round(x2)), 0), width)])
+    y1, y2 = sorted([min(max(int(round(y1)), 0), height), min(max(int(round(y2)), 0), height)])
+    if x2 <= x1 or y2 <= y1:
+        raise ValueError(f"Crop box {spec[1]} is empty for a {width}x{height} image")
+    return x1, y1, x2, y2
+
+
+def load_manifest(manifest_path):
+    """
+    Read a per-file crop manifest. CSV files need the columns file,x1,y1,x2,y2 and an optional
+    units column (pixels or relative). JSON files map a file name to {"box": [...]} or {"relative": [...]}.
+    Relative file names are resolved against the folder of the manifest.
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    crops = {}
+    if manifest_path.lower().endswith(".json"):
+        with open(manifest_path) as manifest_file:
+            for name, entry in json.load(manifest_file).items():
+                units = "relative" if "relative" in entry else "pixels"
+                box = entry["relative"] if units == "relative" else entry["box"]
+                crops[os.path.join(base_dir, name)] = (units, tuple(float(value) for value in box))
+    else:
+        with open(manifest_path, newline="") as manifest_file:
+            for row in csv.DictReader(manifest_file):
+                box = tuple(float(row[key]) for key in ("x1", "y1", "x2", "y2"))
+                crops[os.path.join(base_dir, row["file"])] = ((row.get("units") or "pixels").strip(), box)
+    return crops
+
+
+def collect_images(paths):
+    """Expand files and folders into (image path, path relative to the output folder) pairs"""
+    images = []
+    for path in paths:
+        if os.path.isdir(path):
+            for folder, _, files in os.walk(path):
+                for name in sorted(files):
+                    if name.lower().endswith(IMAGE_EXTENSIONS):
+                        full_path = os.path.join(folder, name)
+                        images.append((full_path, os.path.relpath(full_path, path)))
+        else:
+            images.append((path, os.path.basename(path)))
+    return images
+
+
+def crop_file(source_path, output_path, spec, lossless=False, reencode=True):
+    """
+    Decode, crop and encode one file (runs in a worker process). Returns an error message or None.
+    With lossless a JPEG saved as JPEG is cropped without re-encoding; when that is not possible the
+    crop is re-encoded, or fails when reencode is False.
+    """
+    try:
+        if lossless and output_path.lower().endswith((".jpg", ".jpeg")):
+            header = ProcessImage().read_image_header(source_path)
+            if spec is not None and spec[0] == "suggest":
+                # A reduced decode is enough for the analysis, the crop itself is not decoded at all
+                analysis = ProcessImage()
+                if not analysis.load_image(source_path, max_size=(ANALYSIS_SIZE, ANALYSIS_SIZE)):
+                    raise ValueError(analysis.last_error or "Failed to load image")
+                spec = ("pixels", suggest_source_crop(analysis, spec[1]))
+            try:
+                if header is None:
+                    raise ValueError("Unknown image format")
+                os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+                lossless_jpeg_crop(source_path, output_path, resolve_crop_box(spec, header[0], header[1]))
+                return None
+            except ValueError as e:
+                if not reencode:
+                    return str(e)
+        crop = load_crop(source_path, spec)
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        Image.fromarray(crop).save(output_path)
+        return None
+    except Exception as e:
+        return str(e)
+
+
+def load_crop(source_path, spec):
+    """
+    Decode a file and return its crop for a spec (spec None keeps the whole image, ("suggest", aspect)
+    crops to the suggested crop). Raises ValueError
+    """
+    processor = ProcessImage()
+    if processor.open_tiled(source_path):
+        # Uncompressed image, only the part that is cropped is read from the file
+        width, height = processor.full_size
+    elif processor.load_image(source_path):
+        height, width = processor.current_image.shape[:2]
+    else:
+        raise ValueError(processor.last_error or "Failed to load image")
+    if spec is not None and spec[0] == "suggest":
+        spec = ("pixels", suggest_source_crop(processor, spec[1]))
+    box = resolve_crop_box(spec, width, height) if spec is not None else (0, 0, width, height)
+    return processor.crop_from_source(*box)
+
+
+"""
+Renditions: one crop written at several widths and in several formats, for example for responsive web pages:
+
+    python main.py batch shots -o web --relative 0.1,0.1,0.9,0.9 --widths 320,640,1280,full --formats jpg,webp
+
+The source is decoded once. Every width is resized from the next larger one (INTER_AREA), which is
+cheaper than resampling the full crop each time, and the files are encoded in parallel as soon as their
+size is ready. Files are named <name>_<width>w.<format>.
+"""
+
+
+def parse_widths(text):
+    """Parse "320,640,full" into [320, 640, None] (None is the full crop width)"""
+    widths = []
+    for value in text.replace(" ", "").split(","):
+        if value.lower() in ("full", "0"):
+            widths.append(None)
+        elif value.isdigit():
+            widths.append(int(value))
+        else:
+            raise ValueError(f"Expected widths like 320,640,full but got '{text}'")
+    return widths
+
+
+def parse_formats(text):
+    """Parse "jpg,webp" into a list of extensions"""
+    formats = [value.strip().lower().lstrip(".") for value in text.split(",") if value.strip()]
+    if not formats:
+        raise ValueError("No output formats")
+    return formats
+
+
+def resize_cascade(image, widths):
+    """Yield (width, image) from the largest width down, each size resized from the previous one"""
+    full_width = image.shape[1]
+    # Widths at or above the crop width are the crop itself (no upscaling)
+    targets = sorted({min(width or full_width, full_width) for width in widths}, reverse=True)
+    current = image
+    for width in targets:
+        if width != current.shape[1]:
+            height = max(round(current.shape[0] * width / current.shape[1]), 1)
+            current = cv2.resize(current, (width, height), interpolation=cv2.INTER_AREA)
+        yield width, current
+
+
+def export_renditions(image, output_stem, widths, formats, workers=None):
+    """Write the image at every width and format, returns the written paths"""
+    os.makedirs(os.path.dirname(output_stem) or ".", exist_ok=True)
+
+    def encode(rendition, path):
+        Image.fromarray(rendition).save(path)
+        return path
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        # The encoders of a size run while the next smaller size is resized
+        futures = [executor.submit(encode, rendition, f"{output_stem}_{width}w.{extension}")
+                   for width, rendition in resize_cascade(image, widths) for extension in formats]
+        return [future.result() for future in futures]
+
+
+def renditions_file(source_path, output_path, spec, widths, formats):
+    """Crop one file and write its renditions next to output_path (runs in a worker process). Returns an error or None"""
+    try:
+        formats = formats or [os.path.splitext(source_path)[1].lstrip(".").lower()]
+        export_renditions(load_crop(source_path, spec), os.path.splitext(output_path)[0], widths, formats, workers=2)
+        return None
+    except Exception as e:
+        return str(e)
+
+
+def run_batch_crop(jobs, workers=None, max_in_flight=None, lossless=False, reencode=True, renditions=None):
+    """
+    Run (source, output, spec) jobs across a process pool and yield (source, output, error) as files finish.
+    At most max_in_flight files are submitted at once so memory stays bounded for very large folders.
+    With renditions=(widths, formats) every file is written at those sizes instead of as a single crop.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or workers * 2
+    jobs = iter(jobs)
+    with process_pool.ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+        while True:
+            # Keep the pool busy without queueing the whole folder
+            for source, output, spec in jobs:
+                if renditions is None:
+                    future = executor.submit(crop_file, source, output, spec, lossless, reencode)
+                else:
+                    future = executor.submit(renditions_file, source, output, spec, *renditions)
+                pending[future] = (source, output)
+                if len(pending) >= max_in_flight:
+                    break
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                source, output = pending.pop(future)
+                try:
+                    error = future.result()
+                except Exception as e: # The worker process itself died
+                    error = str(e)
+                yield source, output, error
+
+
+def batch_main(argv=None):
+    """Command line entry point for headless batch cropping, returns the exit code"""
+    parser = argparse.ArgumentParser(prog="main.py batch", description="Crop many images without opening the editor")
+    parser.add_argument("inputs", nargs="*", help="image files or folders")
+    parser.add_argument("-o", "--output", required=True, help="folder for the cropped images")
+    crop_group = parser.add_mutually_exclusive_group(required=True)
+    crop_group.add_argument("--box", type=parse_box, help="crop box in pixels: x1,y1,x2,y2")
+    crop_group.add_argument("--relative", type=parse_box, help="crop box as fractions of the image size: x1,y1,x2,y2")
+    crop_group.add_argument("--manifest", help="CSV or JSON file with a crop box per file")
+    crop_group.add_argument("--suggest", action="store_true", help="crop every image to its suggested crop (borders trimmed, subject kept)")
+    parser.add_argument("--aspect", type=parse_aspect, help="with --suggest, the aspect ratio of the crops, for example 1:1 or 16:9")
+    parser.add_argument("--format", help="output extension (for example png), default keeps the input format")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--lossless", action="store_true",
+                        help="crop JPEGs saved as JPEG without re-encoding (needs jpegtran, the corner snaps to the MCU grid)")
+    parser.add_argument("--no-reencode", action="store_true", help="with --lossless, fail instead of re-encoding")
+    parser.add_argument("--widths", type=parse_widths, help="write every crop at these widths, for example 320,640,full")
+    parser.add_argument("--formats", type=parse_formats, help="with --widths, the formats to write (default: the input format)")
+    args = parser.parse_args(argv)
+    if args.aspect and not args.suggest:
+        parser.error("--aspect only applies to --suggest")
+
+    if args.manifest:
+        crops = load_manifest(args.manifest)
+        images = collect_images(args.inputs) if args.inputs else [(path, os.path.basename(path)) for path in crops]
+    else:
+        if args.suggest:
+            spec = ("suggest", args.aspect)
+        else:
+            spec = ("pixels", args.box) if args.box else ("relative", args.relative)
+        images = collect_images(args.inputs)
+    if not images:
+        parser.error("no images to crop")
+
+    jobs = []
+    for source, relative_path in images:
+        if args.manifest:
+            key = os.path.abspath(source)
+            spec = crops.get(key) or crops.get(os.path.join(os.path.dirname(os.path.abspath(args.manifest)), os.path.basename(source)))
+            if spec is None:
+                print(f"skipped {source}: not in manifest", file=sys.stderr)
+                continue
+        output = os.path.join(args.output, relative_path)
+        if args.format:
+            output = os.path.splitext(output)[0] + "." + args.format.lstrip(".")
+        jobs.append((source, output, spec))
+
+    failed = 0
+    started = time.perf_counter()
+    renditions = None
+    if args.widths:
+        formats = args.formats or ([args.format.lstrip(".")] if args.format else None) # None keeps the input format
+        renditions = (args.widths, formats)
+    for source, output, error in run_batch_crop(jobs, args.workers, lossless=args.lossless, reencode=not args.no_reencode,
+                                                renditions=renditions):
+        if error:
+            failed += 1
+            print(f"error {source}: {error}", file=sys.stderr)
+        else:
+            print(f"ok {source} -> {output}")
+    elapsed = time.perf_counter() - started
+    print(f"Cropped {len(jobs) - failed}/{len(jobs)} images in {elapsed:.2f}s ({failed} failed)")
+    return 1 if failed else 0
+
+
+"""
+Crop templates
+
+A template is a named crop saved from a selection in the editor, stored in ~/.image_editor/templates.json:
+
+    {"product": {"mode": "relative", "box": [0.1, 0.05, 0.9, 0.95]},
+     "logo": {"mode": "anchored", "anchor": [1.0, 0.0], "offset": [-40, 40], "size": [300, 120]}}
+
+Relative templates scale with the image. Anchored templates keep their size in pixels and their distance
+to an anchor of the image (a corner, the middle of an edge or the centre). Applying a template to many images:
+
+    python main.py template list
+    python main.py template apply product shots -o cropped
+
+Images are grouped by size, so each group is decoded into one stacked array and cropped with a single
+slice. Decoding and encoding run in a thread pool (OpenCV releases the GIL) and every crop is written to
+disk as soon as it is encoded.
+"""
+
+
+def default_templates_path():
+    return os.path.join(os.path.expanduser("~"), ".image_editor", "templates.json")
+
+
+def load_templates(path=None):
+    """Return the saved templates by name ({} when none were saved yet)"""
+    try:
+        with open(path or default_templates_path()) as templates_file:
+            return json.load(templates_file)
+    except FileNotFoundError:
+        return {}
+
+
+def save_template(name, template, path=None):
+    """Add or replace a template in the templates file"""
+    path = path or default_templates_path()
+    templates = load_templates(path)
+    templates[name] = template
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "w") as templates_file:
+        json.dump(templates, templates_file, indent=2)
+    os.replace(temporary_path, path) # Never leave a half written file behind
+
+
+def make_template(box, width, height, mode="relative"):
+    """Turn a selection (x1, y1, x2, y2 in source pixels) of a width x height image into a template"""
+    x1, y1, x2, y2 = box
+    if mode == "relative":
+        return {"mode": "relative", "box": [x1 / width, y1 / height, x2 / width, y2 / height]}
+    if mode != "anchored":
+        raise ValueError(f"Unknown template mode '{mode}'")
+    # Anchor to the nearest of the nine points (corners, edge middles, centre) of the image
+    crop_width, crop_height = x2 - x1, y2 - y1
+    anchor_x = round((x1 + crop_width / 2) / width * 2) / 2
+    anchor_y = round((y1 + crop_height / 2) / height * 2) / 2
+    # Offset between the same point of the crop and of the image, so a crop in a corner keeps its margins
+    offset_x = x1 + anchor_x * crop_width - anchor_x * width
+    offset_y = y1 + anchor_y * crop_height - anchor_y * height
+    return {"mode": "anchored", "anchor": [anchor_x, anchor_y], "offset": [offset_x, offset_y],
+            "size": [crop_width, crop_height]}
+
+
+def template_spec(template, width, height):
+    """Crop spec (see resolve_crop_box) of a template for a width x height image"""
+    if template["mode"] == "relative":
+        return ("relative", tuple(template["box"]))
+    (anchor_x, anchor_y), (offset_x, offset_y) = template["anchor"], template["offset"]
+    crop_width, crop_height = template["size"]
+    x1 = anchor_x * width + offset_x - anchor_x * crop_width
+    y1 = anchor_y * height + offset_y - anchor_y * crop_height
+    return ("pixels", (x1, y1, x1 + crop_width, y1 + crop_height))
+
+
+def group_by_size(jobs):
+    """Group (source, output) jobs by image size read from the headers. Unreadable files are returned apart"""
+    header_reader = ProcessImage()
+    groups = OrderedDict()
+    unreadable = []
+    for source, output in jobs:
+        header = header_reader.read_image_header(source)
+        if header is None:
+            unreadable.append((source, output))
+        else:
+            groups.setdefault(header[:2], []).append((source, output))
+    return groups, unreadable
+
+
+def apply_template(template, jobs, workers=None, memory_mb=512):
+    """
+    Crop (source, output) jobs with a template and yield (source, output, error) as each file is written.
+    The images of one size are decoded into a shared (n, height, width, 3) buffer of at most memory_mb
+    and cropped with one slice of that buffer; the crops are encoded in parallel.
+    """
+    workers = workers or os.cpu_count() or 1
+    groups, unreadable = group_by_size(jobs)
+    for source, output in unreadable:
+        yield source, output, "Unknown image format"
+
+    def decode_into(batch, index, source, height, width):
+        image = cv2.imread(source, cv2.IMREAD_COLOR)
+        if image is None:
+            return "Failed to load image"
+        if image.shape[:2] != (height, width):
+            return f"Decoded size {image.shape[1]}x{image.shape[0]} differs from the header"
+        batch[index] = image
+        return None
+
+    def encode(crop, output):
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        if not cv2.imwrite(output, crop):
+            return f"Could not write {output}"
+        return None
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for (width, height), members in groups.items():
+            try:
+                x1, y1, x2, y2 = resolve_crop_box(template_spec(template, width, height), width, height)
+            except ValueError as e:
+                for source, output in members:
+                    yield source, output, str(e)
+                continue
+
+            # As many images as fit in the memory budget share one buffer, reused for the whole group
+            chunk_size = max(1, min(len(members), memory_mb * 2 ** 20 // (width * height * 3)))
+            batch = np.empty((chunk_size, height, width, 3), dtype=np.uint8)
+            for start in range(0, len(members), chunk_size):
+                chunk = members[start:start + chunk_size]
+                decode_errors = list(executor.map(
+                    lambda item: decode_into(batch, item[0], item[1][0], height, width), enumerate(chunk)))
+                crops = batch[:len(chunk), y1:y2, x1:x2] # One slice crops the whole chunk (a view, no copy)
+
+                pending = {}
+                for index, ((source, output), error) in enumerate(zip(chunk, decode_errors)):
+                    if error:
+                        yield source, output, error
+                    else:
+                        pending[executor.submit(encode, crops[index], output)] = (source, output)
+                # Stream the results while the rest of the chunk is still encoding
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        source, output = pending.pop(future)
+                        try:
+                            error = future.result()
+                        except Exception as e:
+                            error = str(e)
+                        yield source, output, error
+            batch = crops = None # Drop the buffer (and the view of it) before the next group allocates its own
+
+
+def template_main(argv=None):
+    """Command line entry point for the crop templates, returns the exit code"""
+    parser = argparse.ArgumentParser(prog="main.py template", description="List crop templates or apply one to many images")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="show the saved templates")
+    apply_parser = commands.add_parser("apply", help="crop images with a saved template")
+    apply_parser.add_argument("name", help="template name")
+    apply_parser.add_argument("inputs", nargs="+", help="image files or folders")
+    apply_parser.add_argument("-o", "--output", required=True, help="folder for the cropped images")
+    apply_parser.add_argument("--format", help="output extension (for example png), default keeps the input format")
+    apply_parser.add_argument("-j", "--workers", type=int, default=None, help="worker threads (default: all cores)")
+    args = parser.parse_args(argv)
+
+    templates = load_templates()
+    if args.command == "list":
+        for name, template in sorted(templates.items()):
+            print(f"{name}: {json.dumps(template)}")
+        return 0
+
+    if args.name not in templates:
+        parser.error(f"unknown template '{args.name}' (saved: {', '.join(sorted(templates)) or 'none'})")
+    jobs = []
+    for source, relative_path in collect_images(args.inputs):
+        output = os.path.join(args.output, relative_path)
+        if args.format:
+            output = os.path.splitext(output)[0] + "." + args.format.lstrip(".")
+        jobs.append((source, output))
+    if not jobs:
+        parser.error("no images to crop")
+
+    failed = 0
+    started = time.perf_counter()
+    for source, output, error in apply_template(templates[args.name], jobs, args.workers):
+        if error:
+            failed += 1
+            print(f"error {source}: {error}", file=sys.stderr)
+        else:
+            print(f"ok {source} -> {output}")
+    elapsed = time.perf_counter() - started
+    print(f"Cropped {len(jobs) - failed}/{len(jobs)} images in {elapsed:.2f}s ({failed} failed)")
+    return 1 if failed else 0
+
+
+"""
+Local crop service
+
+An HTTP service on top of the same processing code, for tools that would otherwise start a script per image:
+
+    python main.py serve --port 8765 --root /srv/masters
+    curl "http://127.0.0.1:8765/load?path=shot.jpg"
+    curl "http://127.0.0.1:8765/crop?path=shot.jpg&box=100,50,900,650&format=jpg" -o crop.jpg
+    curl "http://127.0.0.1:8765/resize?path=shot.jpg&relative=0.1,0.1,0.9,0.9&width=400&format=webp" -o small.webp
+
+Requests are handled by asyncio, decoding and encoding run in worker processes. Every worker keeps an
+ImageCache of decoded sources (checked against the file's mtime) and the requests for one file always go to
+the same worker, so repeated crops of a master image skip the decode. A semaphore bounds the work in flight;
+further requests wait their turn, and a client may send several requests on one keep-alive connection.
+"""
+SERVICE_FORMATS = {"png": ("PNG", "image/png"), "jpg": ("JPEG", "image/jpeg"), "jpeg": ("JPEG", "image/jpeg"),
+                   "webp": ("WEBP", "image/webp"), "bmp": ("BMP", "image/bmp"), "tif": ("TIFF", "image/tiff"),
+                   "tiff": ("TIFF", "image/tiff")}
+service_cache = None # ImageCache of the worker process
+
+
+def service_init(cache_mb):
+    """Worker process initializer"""
+    global service_cache
+    service_cache = ImageCache(budget_mb=cache_mb)
+
+
+def service_source(path):
+    """Return (processor, was cached) for a path, decoding it on a cache miss"""
+    cached = service_cache.get(path)
+    if cached is not None:
+        return cached[0], True
+    processor = ProcessImage()
+    # Uncompressed images are read from their tiles, everything else is decoded once and kept
+    if not processor.open_tiled(path) and not processor.load_image(path):
+        raise ValueError(processor.last_error or "Failed to load image")
+    service_cache.put(path, processor, None)
+    return processor, False
+
+
+def service_load(path):
+    """Worker: make sure a source is decoded, returns its description"""
+    started = time.perf_counter()
+    processor, cached = service_source(path)
+    width, height = processor.full_size
+    return {"path": path, "width": width, "height": height, "cached": cached,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)}
+
+
+def service_crop(path, spec, output_format, quality, size=None):
+    """Worker: crop (and optionally resize) a source and encode it, returns the encoded bytes"""
+    processor, _ = service_source(path)
+    width, height = processor.full_size
+    box = resolve_crop_box(spec, width, height) if spec is not None else (0, 0, width, height)
+    image = processor.crop_from_source(*box)
+    if size is not None:
+        target_width, target_height = size
+        crop_height, crop_width = image.shape[:2]
+        # A missing side keeps the aspect ratio
+        target_width = target_width or max(round(crop_width * target_height / crop_height), 1)
+        target_height = target_height or max(round(crop_height * target_width / crop_width), 1)
+        shrinking = target_width < crop_width
+        image = cv2.resize(image, (target_width, target_height),
+                           interpolation=cv2.INTER_AREA if shrinking else cv2.INTER_CUBIC)
+    data = io.BytesIO()
+    Image.fromarray(image).save(data, SERVICE_FORMATS[output_format][0], quality=quality)
+    return data.getvalue()
+
+
+class CropService:
+    """asyncio HTTP front end of the crop service (see the section docstring)"""
+    STATUS_TEXT = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found", 405: "Method Not Allowed",
+                   500: "Internal Server Error"}
+
+    def __init__(self, root_dir, workers=None, max_in_flight=None, cache_mb=1024):
+        self.root_dir = os.path.realpath(root_dir)
+        workers = workers or os.cpu_count() or 1
+        # One single process pool per worker, so a file always lands on the worker that has it cached
+        self.pools = [process_pool.ProcessPoolExecutor(max_workers=1, initializer=service_init, initargs=(max(cache_mb // workers, 64),))
+                      for _ in range(workers)]
+        self.semaphore = asyncio.Semaphore(max_in_flight or workers * 2)
+        self.requests = 0
+
+    def resolve_path(self, path):
+        """Source file for a request path, which has to be inside the service root"""
+        if not path:
+            raise ValueError("Missing path parameter")
+        full_path = os.path.realpath(os.path.join(self.root_dir, path))
+        if os.path.commonpath([full_path, self.root_dir]) != self.root_dir:
+            raise PermissionError(f"{path} is outside the service root")
+        if not os.path.isfile(full_path):
+            raise FileNotFoundError(f"{path} does not exist")
+        return full_path
+
+    async def run(self, path, function, *args):
+        """Run a worker function on the worker of the path, at most max_in_flight at once"""
+        pool = self.pools[hash(path) % len(self.pools)]
+        async with self.semaphore:
+            return await asyncio.get_running_loop().run_in_executor(pool, function, path, *args)
+
+    async def dispatch(self, method, target):
+        """Return (status, content type, body) for a request"""
+        if method != "GET":
+            return 405, "application/json", json.dumps({"error": "Only GET is supported"}).encode()
+        url = urllib.parse.urlsplit(target)
+        query = {key: values[-1] for key, values in urllib.parse.parse_qs(url.query).items()}
+        try:
+            if url.path == "/health":
+                return 200, "application/json", json.dumps({"status": "ok", "requests": self.requests}).encode()
+            if url.path not in ("/load", "/crop", "/resize"):
+                raise FileNotFoundError(f"Unknown endpoint {url.path}")
+            path = self.resolve_path(query.get("path"))
+            if url.path == "/load":
+                return 200, "application/json", json.dumps(await self.run(path, service_load)).encode()
+
+            spec = None
+            if "box" in query:
+                spec = ("pixels", parse_box(query["box"]))
+            elif "relative" in query:
+                spec = ("relative", parse_box(query["relative"]))
+            output_format = query.get("format", "png").lower()
+            if output_format not in SERVICE_FORMATS:
+                raise ValueError(f"Unknown format '{output_format}'")
+            quality = int(query.get("quality", 90))
+            size = None
+            if url.path == "/resize":
+                size = (int(query.get("width", 0)), int(query.get("height", 0)))
+                if size == (0, 0) or min(size) < 0:
+                    raise ValueError("resize needs a width and/or height")
+            elif spec is None:
+                raise ValueError("crop needs a box or relative parameter")
+            body = await self.run(path, service_crop, spec, output_format, quality, size)
+            return 200, SERVICE_FORMATS[output_format][1], body
+        except PermissionError as e:
+            status, message = 403, str(e)
+        except FileNotFoundError as e:
+            status, message = 404, str(e)
+        except ValueError as e:
+            status, message = 400, str(e)
+        except Exception as e:
+            status, message = 500, str(e)
+        return status, "application/json", json.dumps({"error": message}).encode()
+
+    async def handle_client(self, reader, writer):
+        """Serve the requests of one connection (HTTP/1.1 keep-alive, requests are answered in order)"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                started = time.perf_counter()
+                parts = request_line.decode("latin-1").split()
+                if len(parts) != 3:
+                    body = json.dumps({"error": "Malformed request line"}).encode()
+                    await self.respond(writer, 400, "application/json", body, False, started)
+                    break
+                method, target, version = parts
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                # Only GET is served and the body of anything else is not read, so the connection ends after it
+                keep_alive = method == "GET" and version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+
+                self.requests += 1
+                status, content_type, body = await self.dispatch(method, target)
+                await self.respond(writer, status, content_type, body, keep_alive, started)
+                if not keep_alive:
+                    break
+        except (ConnectionError, ValueError):
+            pass # Client went away or sent something that is not HTTP
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, content_type, body, keep_alive, started):
+        head = (f"HTTP/1.1 {status} {self.STATUS_TEXT[status]}\r\n"
+                f"Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+                f"X-Elapsed-Ms: {(time.perf_counter() - started) * 1000:.1f}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle_client, host, port)
+        print(f"Serving {self.root_dir} on http://{host}:{port} with {len(self.pools)} workers")
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        for pool in self.pools:
+            pool.shutdown(cancel_futures=True)
+
+
+def serve_main(argv=None):
+    """Command line entry point for the local crop service"""
+    parser = argparse.ArgumentParser(prog="main.py serve", description="Local HTTP service for loading, cropping and resizing images")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: only this machine)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--root", default=".", help="folder the image paths are resolved against (and confined to)")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="requests processed at once (default: 2 per worker)")
+    parser.add_argument("--cache-mb", type=int, default=1024, help="memory for decoded images, shared by the workers")
+    args = parser.parse_args(argv)
+
+    service = CropService(args.root, args.workers, args.max_in_flight, args.cache_mb)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+    return 0
+
+
+COMMANDS = {"batch": batch_main, "template": template_main, "serve": serve_main} # python image_core.py <command> ...
+
+
+if __name__ == "__main__":
+    # Same commands as main.py, without loading Tk
+    if len(sys.argv) < 2 or sys.argv[1] not in COMMANDS:
+        print(f"usage: image_core.py {{{','.join(COMMANDS)}}} ...", file=sys.stderr)
+        sys.exit(2)
+    sys.exit(COMMANDS[sys.argv[1]](sys.argv[2:]))
@@ -1,38 +1,634 @@
 import os # used to save the cropped image
+import io
+import sys
+import time # used to throttle redraws while dragging
+import json
+import queue # hands background results back to the Tk loop
+from collections import OrderedDict
+from array import array # compact storage for the undo history
+import struct
+import hashlib
+import sqlite3
+import bisect
+import shutil
+import threading
+import cProfile # optional profiling of the event handlers
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor
 import tkinter as tk 
-from tkinter import filedialog, ttk, messagebox
-from PIL import Image, ImageTk #PIL (Python Imaging Library) is used for image processing
-import cv2 # OpenCV library for image processing
-import numpy as np 
+from tkinter import filedialog, ttk, messagebox, simpledialog
+# Image processing lives in image_core, which imports OpenCV, NumPy and PIL only when they are first used
+from image_core import (LazyModule, Image, cv2, np, preload_modules, IMAGE_EXTENSIONS, ProcessImage,
+                        plan_lossless_jpeg_crop, lossless_jpeg_crop, DisplayMapping, ImagePyramid, subtract_rect,
+                        RegionIndex, ImageCache, make_thumbnail, ThumbnailCache, suggest_source_crop, parse_widths,
+                        parse_formats, export_renditions, load_templates, save_template, make_template, apply_template,
+                        COMMANDS)
+
+ImageTk = LazyModule("PIL.ImageTk") # Tk photos of PIL images
+
+class MaskCompositor:
+    """
+    Composites the selection mask on the canvas. The dimmed copy of the displayed image is computed
+    once per displayed image and size, after that a selection change only copies the clear rectangle
+    over the cached dimmed frame (Tk photo copies), so the cost scales with the selection and not the frame.
+
+    The photos and the dimmed buffer are allocated once per display size: later frames are pasted into
+    them, so redraws do not allocate new display sized images.
+    """
+    def __init__(self, alpha=0.6):
+        self.alpha = alpha # 60% dark overlay
+        self.image = None # Display sized image the cached frames were built from
+        self.bright = None # Displayed image without the mask
+        self.dimmed = None # Displayed image with the dark overlay applied
+        self.frame = None # Image shown on the canvas
+        self.size = None # (width, height) of the photos
+        self.dimmed_buffer = None # Reused array for the dimmed pixels
+        self.selection = None # Rectangle that is currently clear in the frame
+
+    def prepare(self, image):
+        """Fill the bright and dimmed frames from a newly rendered display image"""
+        h, w = image.shape[:2]
+
+        # Blending with a black overlay is the same as scaling the image by (1 - alpha)
+        if self.dimmed_buffer is None or self.dimmed_buffer.shape != image.shape:
+            self.dimmed_buffer = np.empty_like(image)
+        cv2.convertScaleAbs(image, dst=self.dimmed_buffer, alpha=1 - self.alpha)
+
+        if self.size == (w, h):
+            # Same size as the last frame, paste into the existing photos
+            self.bright.paste(Image.fromarray(image))
+            self.dimmed.paste(Image.fromarray(self.dimmed_buffer))
+        else:
+            self.bright = ImageTk.PhotoImage(Image.fromarray(image))
+            self.dimmed = ImageTk.PhotoImage(Image.fromarray(self.dimmed_buffer))
+            self.frame = tk.PhotoImage(width=w, height=h)
+            self.size = (w, h)
+        self.copy_region(self.bright, 0, 0, w, h)
+        self.image = image
+        self.selection = None
+
+    def copy_region(self, source, x1, y1, x2, y2):
+        """Copy a rectangle of the source photo into the same place in the frame"""
+        if x2 > x1 and y2 > y1:
+            self.frame.tk.call(str(self.frame), "copy", str(source), "-from", x1, y1, x2, y2, "-to", x1, y1)
+
+    def set_selection(self, x1, y1, x2, y2):
+        """Make (x1, y1, x2, y2) the clear area of the frame and dim everything else"""
+        if self.image is None or self.selection == (x1, y1, x2, y2):
+            return
+        new_selection = (x1, y1, x2, y2)
+        if self.selection is None:
+            # First selection on this image, dim the whole frame once
+            h, w = self.image.shape[:2]
+            self.copy_region(self.dimmed, 0, 0, w, h)
+            self.copy_region(self.bright, *new_selection)
+        else:
+            # Only the strips that changed between the old and the new rectangle are repainted
+            for strip in subtract_rect(self.selection, new_selection):
+                self.copy_region(self.dimmed, *strip)
+            for strip in subtract_rect(new_selection, self.selection):
+                self.copy_region(self.bright, *strip)
+        self.selection = new_selection
+
+    def clear_selection(self):
+        """Show the image without the mask"""
+        if self.image is not None and self.selection is not None:
+            h, w = self.image.shape[:2]
+            self.copy_region(self.bright, 0, 0, w, h)
+            self.selection = None
+
+
+class SelectionHistory:
+    """
+    Bounded undo/redo history of selections. Every step is an (x1, y1, x2, y2) row in source pixels, stored in a
+    preallocated array('i') used as a ring buffer, so memory stays the same however long the editing session is.
+    The oldest steps are dropped once the configured depth is reached.
+
+    The history can be written to an append-only journal on disk (one small binary record per change),
+    and replaying the journal restores the history of an image after the app was closed or crashed.
+    The journal file is only created once the image gets a selection, and only the most recently used
+    JOURNAL_LIMIT journals are kept.
+    """
+    EMPTY = (-1, -1, -1, -1) # Row used for "no selection"
+    JOURNAL_LIMIT = 500 # Journal files kept in the journal folder, the least recently used are deleted
+
+    # Journal record: operation and the four coordinates
+    RECORD = struct.Struct("<b4i")
+    PUSH, MERGE, UNDO, REDO = 1, 2, 3, 4
+
+    def __init__(self, depth=256):
+        self.depth = depth
+        self.rows = array("i", [0]) * (depth * 4)
+        self.reset()
+        self.journal = None
+        self.journal_path = None
+        self.journal_records = 0
+
+    def reset(self):
+        """Forget all steps (the journal file is left alone)"""
+        self.start = 0 # Ring index of the oldest step
+        self.count = 0 # Number of steps stored
+        self.cursor = -1 # Position of the current step (0 is the oldest)
+        self.merge_key = None # Key of the last push, equal keys merge into one step
+
+    def row_index(self, position):
+        return ((self.start + position) % self.depth) * 4
+
+    def get(self, position):
+        index = self.row_index(position)
+        return tuple(self.rows[index:index + 4])
+
+    def set(self, position, state):
+        index = self.row_index(position)
+        self.rows[index:index + 4] = array("i", state)
+
+    def current(self):
+        """Return the current step, or None when the history is empty"""
+        return self.get(self.cursor) if self.cursor >= 0 else None
+
+    def can_undo(self):
+        return self.cursor > 0
+
+    def can_redo(self):
+        return self.cursor < self.count - 1
+
+    def push(self, state, merge_key=None):
+        """Add a step after the current one (dropping the redo steps). A step with the same merge key as the previous push replaces it"""
+        if merge_key is not None and merge_key == self.merge_key and self.cursor == self.count - 1:
+            self.set(self.cursor, state)
+            self.write_journal(self.MERGE, state)
+            return
+        self.count = self.cursor + 1 # A new step clears the redo history
+        if self.count == self.depth:
+            # Full, drop the oldest step
+            self.start = (self.start + 1) % self.depth
+            self.count -= 1
+        self.set(self.count, state)
+        self.count += 1
+        self.cursor = self.count - 1
+        self.merge_key = merge_key
+        self.write_journal(self.PUSH, state)
+
+    def undo(self):
+        """Move back one step and return it"""
+        if not self.can_undo():
+            return None
+        self.cursor -= 1
+        self.merge_key = None
+        self.write_journal(self.UNDO, self.EMPTY)
+        return self.current()
+
+    def redo(self):
+        """Move forward one step and return it"""
+        if not self.can_redo():
+            return None
+        self.cursor += 1
+        self.merge_key = None
+        self.write_journal(self.REDO, self.EMPTY)
+        return self.current()
 
-class ProcessImage:
     """
-    This class handles the image loading and processing. 
-    It provides functionality to load the chosen image using openCV and also handles colour conversion from BGR to RGB
+    Journal on disk
     """
-    def __init__ (self):
-        self.current_image = None
+    @staticmethod
+    def journal_path_for(image_path):
+        """Journal file of an image, the key includes the file size and time so an edited image starts fresh"""
+        stat = os.stat(image_path)
+        key = f"{os.path.abspath(image_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+        name = hashlib.sha1(key.encode("utf-8")).hexdigest() + ".journal"
+        return os.path.join(os.path.expanduser("~"), ".image_editor", "journals", name)
+
+    def open_journal(self, journal_path):
+        """
+        Load the history from a journal (if it exists) and keep appending changes to it.
+        A missing journal is created by the first step that has a selection.
+        """
+        self.close_journal()
+        self.reset()
+        self.journal_path = None # Replaying must not write to the journal
+        if os.path.exists(journal_path):
+            with open(journal_path, "rb") as journal:
+                data = journal.read()
+            usable = len(data) - len(data) % self.RECORD.size # A crash can leave half a record at the end
+            for op, *state in self.RECORD.iter_unpack(data[:usable]):
+                self.replay(op, tuple(state))
+            self.journal_path = journal_path
+            self.compact_journal()
+        else:
+            self.journal_path = journal_path
+
+    def replay(self, op, state):
+        if op == self.PUSH:
+            self.merge_key = None
+            self.push(state)
+        elif op == self.MERGE and self.count > 0:
+            self.set(self.cursor, state)
+        elif op == self.UNDO:
+            self.undo()
+        elif op == self.REDO:
+            self.redo()
+
+    def compact_journal(self):
+        """Rewrite the journal with only the steps that are still in the history"""
+        records = [self.RECORD.pack(self.PUSH, *self.get(position)) for position in range(self.count)]
+        records += [self.RECORD.pack(self.UNDO, *self.EMPTY)] * (self.count - 1 - self.cursor)
+        temporary_path = self.journal_path + ".tmp"
+        with open(temporary_path, "wb") as journal:
+            journal.write(b"".join(records))
+        os.replace(temporary_path, self.journal_path) # Atomic, a crash never leaves a broken journal
+        if self.journal is not None:
+            self.journal.close()
+        self.journal = open(self.journal_path, "ab")
+        self.journal_records = len(records)
+
+    def write_journal(self, op, state):
+        if self.journal is None:
+            if self.journal_path is None or all(self.get(position) == self.EMPTY for position in range(self.count)):
+                return # No journal, or nothing worth keeping yet (the image was only viewed)
+            os.makedirs(os.path.dirname(self.journal_path), exist_ok=True)
+            self.compact_journal() # Creates the file with every step so far, this change included
+            self.prune_journals(os.path.dirname(self.journal_path))
+            return
+        self.journal.write(self.RECORD.pack(op, *state))
+        self.journal.flush()
+        self.journal_records += 1
+        if self.journal_records > self.depth * 4:
+            self.compact_journal() # Keep the journal file from growing forever
+
+    def close_journal(self):
+        if self.journal is not None:
+            self.journal.close()
+        self.journal = None
+        self.journal_path = None
 
-    def load_image(self, image_path):
-        """Load an image using OpenCV."""
+    @classmethod
+    def prune_journals(cls, journal_dir, keep=None):
+        """Delete all but the keep (default JOURNAL_LIMIT) most recently written journals of a folder"""
+        keep = cls.JOURNAL_LIMIT if keep is None else keep
         try:
-            image = cv2.imread(image_path)
-            if image is None:
-                raise ValueError("Failed to load image")
+            journals = [entry for entry in os.scandir(journal_dir) if entry.name.endswith(".journal")]
+        except OSError:
+            return
+        if len(journals) <= keep:
+            return
+        journals.sort(key=lambda entry: entry.stat().st_mtime_ns, reverse=True)
+        for entry in journals[keep:]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass # Removed by another instance of the editor
+
+
+class BackgroundTasks:
+    """
+    Runs decode and encode work on worker threads (OpenCV and PIL release the GIL while they work)
+    and hands the results back to the Tk loop through a queue that is polled with root.after,
+    so the window stays responsive while large images load or save.
+
+    Every task has a name. Submitting a new task with the same name supersedes the older one:
+    the old result is ignored when it arrives (and it is not started at all if it was still queued).
+    """
+    def __init__(self, root, on_progress=None, workers=2, poll_interval=50):
+        self.root = root
+        self.on_progress = on_progress # Called with (description, elapsed seconds) while tasks run
+        self.poll_interval = poll_interval # ms
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.results = queue.Queue()
+        self.tasks = {} # name -> (token, future, start time, description, on_done, on_error)
+        self._poll_job = None
 
-            # Convert from BGR to RGB
-            self.current_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            self.current_image_path = image_path
+    def submit(self, name, description, work, on_done, on_error=None):
+        """Run work() in the background, then on_done(result, elapsed) or on_error(error) on the Tk thread"""
+        self.cancel(name) # A newer task supersedes the older one
+        token = object()
+        future = self.executor.submit(work)
+        self.tasks[name] = (token, future, time.perf_counter(), description, on_done, on_error)
+        future.add_done_callback(lambda f: self.results.put((name, token, f)))
+        if self._poll_job is None:
+            self._poll_job = self.root.after(self.poll_interval, self.poll)
+        return token
+
+    def cancel(self, name):
+        """Forget a task, its result is ignored (a task that did not start yet is not run at all)"""
+        task = self.tasks.pop(name, None)
+        if task is not None:
+            task[1].cancel()
             return True
+        return False
 
-        except Exception as e:
-            print(f"Error: {str(e)}")
-            tk.messagebox.showerror("Error", f"Unexpected error while loading image: {str(e)}")
-            return False
+    def is_running(self, name):
+        return name in self.tasks
+
+    def poll(self):
+        """Deliver finished results on the Tk thread and report progress of the running tasks"""
+        self._poll_job = None
+        while True:
+            try:
+                name, token, future = self.results.get_nowait()
+            except queue.Empty:
+                break
+            task = self.tasks.get(name)
+            if task is None or task[0] is not token or future.cancelled():
+                continue # Superseded or cancelled, drop the result
+            del self.tasks[name]
+            _, _, started, _, on_done, on_error = task
+            error = future.exception()
+            if error is None:
+                on_done(future.result(), time.perf_counter() - started)
+            elif on_error is not None:
+                on_error(error)
+
+        if self.tasks:
+            if self.on_progress is not None:
+                # Show the oldest running task and how long it has been running (quiet tasks have no description)
+                visible = [task for task in self.tasks.values() if task[3]]
+                if visible:
+                    _, _, started, description, _, _ = min(visible, key=lambda task: task[2])
+                    self.on_progress(description, time.perf_counter() - started)
+            if self._poll_job is None: # A callback that submitted a task has already scheduled the next poll
+                self._poll_job = self.root.after(self.poll_interval, self.poll)
+
+
+class ThumbnailStrip:
+    """
+    Scrollable column of thumbnails of a folder, docked next to the canvas. Clicking one calls on_select(path).
+
+    Only the rows in view have canvas items and PhotoImages: a small pool of items is moved to the visible
+    rows while scrolling, so a folder of thousands of images costs the same to show as a screenful.
+    Thumbnails come from the ThumbnailCache; the missing ones are made with a reduced decode on a
+    background pool (nearest to the current image first) and handed to the Tk loop by BackgroundTasks.
+    """
+    def __init__(self, parent, root, on_select, size=96, cache=None, workers=None, chunk_size=16):
+        self.root = root
+        self.on_select = on_select
+        self.size = size # Thumbnails fit in size x size
+        self.row_height = size + 22 # Room for the file name under the thumbnail
+        self.cache = cache or ThumbnailCache()
+        self.tasks = BackgroundTasks(root, workers=workers or min(4, os.cpu_count() or 1))
+        self.chunk_size = chunk_size # Images per background task
+        self.folder = None
+        self.paths = []
+        self.thumbnails = {} # path -> JPEG bytes
+        self.photos = {} # row -> PhotoImage, only for the visible rows
+        self.slots = [] # Pool of (image item, text item)
+        self.pending = [] # Names of the queued background tasks
+        self.current = None
+
+        self.canvas = tk.Canvas(parent, width=size + 16, bg="#f0f0f0", highlightthickness=0)
+        self.scrollbar = ttk.Scrollbar(parent, orient=tk.VERTICAL, command=self.on_scroll)
+        self.canvas.configure(yscrollcommand=self.scrollbar.set)
+        self.highlight = self.canvas.create_rectangle(0, 0, 0, 0, outline="#0078d7", width=2, state=tk.HIDDEN)
+        self.canvas.bind("<Configure>", lambda event: self.refresh())
+        self.canvas.bind("<ButtonPress-1>", self.on_click)
+        self.canvas.bind("<MouseWheel>", self.on_wheel)
+        self.canvas.bind("<Button-4>", self.on_wheel)
+        self.canvas.bind("<Button-5>", self.on_wheel)
+
+    def pack(self, **options):
+        self.canvas.pack(side=tk.LEFT, fill=tk.Y, **options)
+        self.scrollbar.pack(side=tk.LEFT, fill=tk.Y, **options)
+
+    def show_folder(self, folder, paths, current=None):
+        """Show the thumbnails of a folder (paths in display order) and highlight current"""
+        if folder != self.folder or paths != self.paths:
+            for name in self.pending:
+                self.tasks.cancel(name) # Thumbnails of the previous folder are not needed any more
+            self.pending = []
+            self.folder = folder
+            self.paths = list(paths)
+            self.thumbnails = {}
+            self.photos = {}
+            self.canvas.configure(scrollregion=(0, 0, self.size + 16, len(self.paths) * self.row_height))
+            self.canvas.yview_moveto(0)
+            # Stat the files and look them up in the cache off the Tk thread
+            paths = self.paths
+            self.tasks.submit("lookup", None, lambda: self.lookup(paths), self.on_lookup_done)
+            self.pending.append("lookup")
+        self.set_current(current)
+        self.refresh()
+
+    def lookup(self, paths):
+        """Worker: stat the files and read the cached thumbnails, returns (entries, found)"""
+        entries = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+                entries.append((path, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                pass
+        return entries, self.cache.get_many(entries, self.size)
+
+    def on_lookup_done(self, result, elapsed):
+        entries, found = result
+        self.thumbnails.update(found)
+        self.refresh()
+        missing = [entry for entry in entries if entry[0] not in found]
+        # Make the thumbnails around the current image first
+        if self.current in self.paths:
+            index = self.paths.index(self.current)
+            order = {path: abs(row - index) for row, path in enumerate(self.paths)}
+            missing.sort(key=lambda entry: order.get(entry[0], 0))
+        for start in range(0, len(missing), self.chunk_size):
+            name = f"thumbnails:{start}"
+            chunk = missing[start:start + self.chunk_size]
+            self.tasks.submit(name, None, lambda chunk=chunk: self.generate(chunk), self.on_generated)
+            self.pending.append(name)
+
+    def generate(self, entries):
+        """Worker: make and store the thumbnails of (path, mtime_ns, file_size) entries"""
+        rows = []
+        for path, mtime, file_size in entries:
+            data = make_thumbnail(path, self.size)
+            if data is not None:
+                rows.append((path, mtime, file_size, data))
+        if rows:
+            try:
+                self.cache.put_many(rows, self.size)
+            except sqlite3.Error as e:
+                print(f"Error: {str(e)}") # Still shown, just not cached
+        return {path: data for path, _, _, data in rows}
+
+    def on_generated(self, thumbnails, elapsed):
+        self.thumbnails.update(thumbnails)
+        self.refresh()
+
+    def visible_rows(self):
+        top = self.canvas.canvasy(0)
+        first = max(int(top // self.row_height), 0)
+        last = min(int((top + self.canvas.winfo_height()) // self.row_height) + 1, len(self.paths))
+        return first, last
+
+    def refresh(self):
+        """Point the item pool at the visible rows"""
+        first, last = self.visible_rows()
+        while len(self.slots) < last - first:
+            self.slots.append((self.canvas.create_image(0, 0, anchor=tk.N),
+                               self.canvas.create_text(0, 0, anchor=tk.N, font=("Segoe UI", 8))))
+        self.photos = {row: photo for row, photo in self.photos.items() if first <= row < last}
+
+        for slot, (image_item, text_item) in enumerate(self.slots):
+            row = first + slot
+            if row >= last:
+                self.canvas.itemconfigure(image_item, state=tk.HIDDEN)
+                self.canvas.itemconfigure(text_item, state=tk.HIDDEN)
+                continue
+            path = self.paths[row]
+            if row not in self.photos and path in self.thumbnails:
+                self.photos[row] = ImageTk.PhotoImage(Image.open(io.BytesIO(self.thumbnails[path])))
+            y = row * self.row_height
+            center_x = (self.size + 16) / 2
+            self.canvas.coords(image_item, center_x, y + 4)
+            self.canvas.itemconfigure(image_item, image=self.photos.get(row, ""), state=tk.NORMAL)
+            self.canvas.coords(text_item, center_x, y + self.size + 6)
+            name = os.path.basename(path)
+            self.canvas.itemconfigure(text_item, text=name if len(name) <= 16 else name[:15] + "…", state=tk.NORMAL)
+        self.canvas.tag_raise(self.highlight)
+
+    def set_current(self, path):
+        """Highlight the row of path and scroll it into view"""
+        self.current = path
+        if path not in self.paths:
+            self.canvas.itemconfigure(self.highlight, state=tk.HIDDEN)
+            return
+        row = self.paths.index(path)
+        y = row * self.row_height
+        self.canvas.coords(self.highlight, 2, y + 1, self.size + 14, y + self.row_height - 1)
+        self.canvas.itemconfigure(self.highlight, state=tk.NORMAL)
+        first, last = self.visible_rows()
+        if not first <= row < last - 1 and self.paths:
+            self.canvas.yview_moveto(max(row - 1, 0) / len(self.paths))
+
+    def on_scroll(self, *args):
+        self.canvas.yview(*args)
+        self.refresh()
+
+    def on_wheel(self, event):
+        up = event.num == 4 or getattr(event, "delta", 0) > 0
+        self.canvas.yview_scroll(-1 if up else 1, "units")
+        self.refresh()
+
+    def on_click(self, event):
+        row = int(self.canvas.canvasy(event.y) // self.row_height)
+        if 0 <= row < len(self.paths):
+            self.on_select(self.paths[row])
+
+
+class LatencyHistogram:
+    """Counts latencies in fixed, doubling buckets (0.125 ms up to about 4 s), so recording never allocates"""
+    BUCKETS_MS = [0.125 * 2 ** i for i in range(16)]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS_MS) + 1) # Last bucket collects everything slower
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.last_ms = 0.0
+
+    def add(self, ms):
+        self.counts[bisect.bisect_left(self.BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.last_ms = ms
+
+    def percentile(self, percent):
+        """Upper edge of the bucket that holds the percentile"""
+        if self.count == 0:
+            return 0.0
+        rank = self.count * percent / 100
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return self.BUCKETS_MS[index] if index < len(self.BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "max_ms": round(self.max_ms, 3),
+            "buckets_ms": self.BUCKETS_MS,
+            "counts": self.counts
+        }
+
+
+class LatencyProfiler:
+    """
+    Opt-in latency instrumentation for the editor. Event handlers are wrapped with wrap() and the conversion
+    steps inside them (decode, resize, PhotoImage creation, canvas work...) are timed with stage(), every
+    timing goes into an in-memory histogram per name. When it is disabled the wrappers only check a flag.
+    A cProfile run of the same code can be recorded as well.
+    """
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.histograms = {} # "event:<handler>" or "stage:<step>" -> LatencyHistogram
+        self.lock = threading.Lock() # Stages also run on the background threads
+        self.last_event = None
+        self.cprofile = None
+
+    def record(self, name, ms):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = LatencyHistogram()
+            histogram.add(ms)
+
+    @contextmanager
+    def timed(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - started) * 1000)
+
+    def stage(self, name):
+        """Time a step inside a handler: with profiler.stage("decode"): ..."""
+        return self.timed("stage:" + name) if self.enabled else nullcontext()
+
+    def wrap(self, name, handler):
+        """Return the handler wrapped so each call is timed as an event"""
+        def timed_handler(*args, **kwargs):
+            if not self.enabled:
+                return handler(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return handler(*args, **kwargs)
+            finally:
+                self.record("event:" + name, (time.perf_counter() - started) * 1000)
+                self.last_event = name
+        return timed_handler
+
+    def frame_summary(self):
+        """One line for the status bar: the last handler and its latency percentiles"""
+        if self.last_event is None:
+            return "Profiling: waiting for events"
+        histogram = self.histograms["event:" + self.last_event]
+        return (f"Frame {histogram.last_ms:.1f} ms ({self.last_event}) | "
+                f"p50 {histogram.percentile(50):g} ms, p95 {histogram.percentile(95):g} ms, {histogram.count} calls")
+
+    def to_dict(self):
+        with self.lock:
+            return {name: histogram.to_dict() for name, histogram in sorted(self.histograms.items())}
 
-    def get_current_image(self):
-        """Return the currently loaded image."""
-        return self.current_image
+    def dump_json(self, path):
+        with open(path, "w") as dump_file:
+            json.dump(self.to_dict(), dump_file, indent=2)
+        return path
+
+    def toggle_cprofile(self, path):
+        """Start a cProfile recording, or stop it and write it to path. Returns the path when written"""
+        if self.cprofile is None:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+            return None
+        self.cprofile.disable()
+        self.cprofile.dump_stats(path)
+        self.cprofile = None
+        return path
 
 
 class LoadingImage:
@@ -44,8 +640,24 @@ class LoadingImage:
     this class also has keyboard shortcuts: 
     Ctrl+Z: Undo last action
     Ctrl+Y: Redo last undone action
+    Ctrl+G: Select a suggested crop (keeps the aspect ratio of the current selection)
     Ctrl+S: Save cropped image
     Ctrl+O: Open/load image
+    Ctrl+Shift+O: Show the thumbnails of a folder
+    Ctrl+M: Toggle the live mask preview while dragging
+    Ctrl+0: Fit the whole image in the window
+    Escape: Cancel the image that is loading
+    Ctrl+R: Reopen the image of the last session with its undo history
+    Page Down/Page Up: Open the next/previous image in the same folder
+    Ctrl+Shift+I: Toggle latency instrumentation with a live frame time readout
+    Ctrl+Shift+D: Dump the latency histograms as JSON
+    Ctrl+Shift+P: Start/stop a cProfile recording of the event handlers
+    Enter: Add the selection to the crop regions
+    Delete: Remove the selected crop region
+    Ctrl+E: Export all crop regions
+
+    Mouse wheel zooms around the cursor and dragging with the middle (or right) button pans the view.
+    The strip left of the canvas shows the thumbnails of the current folder, click one to open it.
     
     """
     def __init__(self, main_window):
@@ -71,47 +683,154 @@ class LoadingImage:
         # Initialize variables
         self.processor = ProcessImage()
         self.start_x = self.start_y = self.end_x = self.end_y = None
-        self.drawn_shapes = []
-        self.undo_stack = []
-        self.redo_stack = []
+        self.drawn_shapes = [] # Selection rectangle and handles, created once and reused
+        self.selection_rect = None
+        self.handle_items = {}
+        self.selection_visible = False
+        self.image_item = None # Canvas item showing the image, reused for every redraw
+        self.history = SelectionHistory(depth=256) # Undo/redo steps, journaled to disk per image
+        self.last_session_path = os.path.join(os.path.expanduser("~"), ".image_editor", "last_session")
         self.active_handle = None
         self.handle_positions = {}
         self.original_coords = None
+        self.regions = {} # Region id -> (x1, y1, x2, y2) in source pixels
+        self.region_items = {} # Region id -> (rectangle, {handle name: handle}, label) canvas items
+        self.region_index = None # RegionIndex of the regions for hit testing
+        self.next_region_id = 0
+        self.selected_region = None
+        self.region_drag = None # (region id, handle or None to move, source point at press, box at press)
+        self.region_click = None # (region id, press x, press y, selection before the press) for a click on a region
+        self.lossless_jpeg = shutil.which("jpegtran") is not None # Lossless JPEG crops need the jpegtran tool
+        self.rendition_widths = "320,640,1280,full" # Last answers of the Save Sizes dialog
+        self.rendition_formats = "jpg,webp"
+        self.original_image = None
+        self.processed_image = None # Display sized copy of the image shown on the canvas
+        self.cropped_image = None # Display sized crop used for the preview
+        self.mapping = None # Maps canvas coordinates back to source pixels
+        self.compositor = MaskCompositor() # Caches the dimmed frame for the selection mask
+        self.live_mask = True # Dim the image while the selection is dragged
+        self.frame_interval = 1000 / 60 # At most one drag redraw per display frame (ms)
+        self._drag_job = None
+        self._last_drag_redraw = 0.0
+        self.pyramid = None # Multi-resolution copies of the loaded image
+        self.zoom = 1.0 # 1.0 fits the whole image in the canvas
+        self.view_center = None # Source point shown at the centre of the canvas
+        self.max_pixel_zoom = 16 # Canvas pixels per source pixel at the highest zoom
+        self._display_job = None
+        self._pan_start = None
+        self._source_selection = None # (canvas selection, exact source selection) to avoid rounding drift
+        self.tasks = BackgroundTasks(self.root, on_progress=self.show_progress) # Background decode/encode
+        self.preview_cache = OrderedDict() # Scale percent -> finished LANCZOS preview (LRU)
+        self.preview_cache_size = 8
+        self.preview_settle_delay = 150 # ms without slider movement before the LANCZOS pass
+        self.preview_source = None
+        self.preview_pil_image = None
+        self.preview_image = None
+        self._preview_job = None
+        self.image_cache = ImageCache(budget_mb=1024) # Decoded images of the folder being browsed
+        self.prefetching = {} # Prefetch slot -> path being decoded
+        # Prefetches run on their own single worker, so they never hold up the image the user opens
+        self.prefetch_tasks = BackgroundTasks(self.root, workers=1)
+        self.pending_open = None # Image waiting for its prefetch to finish
+        self.folder_path = None
+        self.folder_listing = []
+
+        # Optional latency instrumentation (IMAGE_EDITOR_PROFILE=1 turns it on at startup)
+        self.profiler = LatencyProfiler(enabled=os.environ.get("IMAGE_EDITOR_PROFILE") == "1")
+        self.profile_dir = os.path.join(os.path.expanduser("~"), ".image_editor", "profiles")
+        self._readout_job = None
+        for handler in ("on_mouse_press", "on_mouse_drag", "on_mouse_release", "handle_resize", "open_image",
+                        "redraw_drag", "display_image", "resize_preview", "on_mouse_wheel", "on_pan_drag"):
+            setattr(self, handler, self.profiler.wrap(handler, getattr(self, handler)))
+
         self.create_toolbar()
         self.create_status_bar()
         self.create_canvas()
+        self.create_thumbnail_strip()
+        self.create_resize_slider()
         self.keybind_shortcuts()
+        self.update_history_buttons()
         self.root.bind("<Configure>", self.handle_resize)
+        if self.profiler.enabled:
+            self.update_profile_readout()
+
+    def create_thumbnail_strip(self):
+        """Thumbnails of the current folder, docked to the left of the canvas"""
+        self.thumbnail_strip = ThumbnailStrip(self.canvas_container, self.root, self.open_image)
+        self.thumbnail_strip.pack(before=self.canvas)
 
     def create_resize_slider(self):
         """Creating a slider for resizing the preview of the cropped image"""
         self.slider_frame = ttk.LabelFrame(self.root, text="Resize Preview", padding="5")
-        self.slider_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=5, pady=5)
+        self.slider_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=5, pady=5, before=self.main_container)
+
+        # Preview canvas, the cropped image is shown here instead of on the main canvas
+        self.preview_canvas = tk.Canvas(self.slider_frame, height=160, bg="white", highlightthickness=0)
+        self.preview_canvas.pack(fill=tk.X, padx=10)
+        self.preview_item = self.preview_canvas.create_image(10, 10, anchor=tk.NW)
 
         # Slider widget (scale from 10% to 200%)
         self.resize_slider = ttk.Scale(self.slider_frame, from_=10, to=200, orient=tk.HORIZONTAL, command=self.resize_preview)
         self.resize_slider.set(100)  # Default size (100%)
         self.resize_slider.pack(fill=tk.X, padx=10, pady=5)
 
+    """
+    The slider fires many callbacks per second while it is dragged, so the preview is rendered in two passes:
+    a fast NEAREST resize is shown straight away and a single LANCZOS resize is done once the slider stops moving.
+    The finished LANCZOS previews of the last few scale levels are kept in a small LRU cache.
+    """
     def resize_preview(self, scale_value):
         """Resized the cropped image preview dynamically"""
-        if self.cropped_image is None:
+        if self.cropped_image is None or self.cropped_image.size == 0:
             return
 
-        # Convert scale value to float and apply resizing
-        scale_factor = float(scale_value) / 100.0
-        image = Image.fromarray(self.cropped_image)
+        # Whole percent steps, the slider reports fractions that would never hit the cache
+        scale = max(int(round(float(scale_value))), 1)
 
-        # Compute new dimensions
-        new_width = int(image.width * scale_factor)
-        new_height = int(image.height * scale_factor)
+        # A new crop invalidates the cached previews
+        if self.preview_source is not self.cropped_image:
+            self.preview_source = self.cropped_image
+            self.preview_pil_image = Image.fromarray(self.cropped_image)
+            self.preview_cache.clear()
+
+        if self._preview_job is not None:
+            self.root.after_cancel(self._preview_job)
+            self._preview_job = None
+
+        cached = self.preview_cache.get(scale)
+        if cached is not None:
+            self.preview_cache.move_to_end(scale) # Most recently used
+            self.show_preview(cached)
+            return
 
-        resized_image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+        # Fast first pass while the slider moves, then the high quality pass when it settles
+        with self.profiler.stage("preview_fast_resize"):
+            fast_image = self.preview_pil_image.resize(self.preview_size(scale), Image.Resampling.NEAREST)
+        with self.profiler.stage("photoimage"):
+            self.show_preview(ImageTk.PhotoImage(fast_image))
+        self._preview_job = self.root.after(self.preview_settle_delay, lambda: self.render_final_preview(scale))
 
-        # Convert to Tkinter-compatible format and update display
-        self.preview_image = ImageTk.PhotoImage(resized_image)
-        self.canvas.delete("all")
-        self.canvas.create_image(10, 10, image=self.preview_image, anchor=tk.NW)
+    def preview_size(self, scale):
+        """Size of the preview at a scale in percent"""
+        image = self.preview_pil_image
+        return max(int(image.width * scale / 100), 1), max(int(image.height * scale / 100), 1)
+
+    def render_final_preview(self, scale):
+        """Render the LANCZOS preview once the slider value stopped changing"""
+        self._preview_job = None
+        with self.profiler.stage("preview_lanczos_resize"):
+            resized_image = self.preview_pil_image.resize(self.preview_size(scale), Image.Resampling.LANCZOS)
+        with self.profiler.stage("photoimage"):
+            preview = ImageTk.PhotoImage(resized_image)
+        self.preview_cache[scale] = preview
+        if len(self.preview_cache) > self.preview_cache_size:
+            self.preview_cache.popitem(last=False) # Drop the least recently used level
+        self.show_preview(preview)
+
+    def show_preview(self, preview):
+        # Convert to Tkinter-compatible format and update display (the preview item is reused)
+        self.preview_image = preview
+        self.preview_canvas.itemconfigure(self.preview_item, image=preview)
 
     def create_toolbar(self):
         """Creates a modern toolbar containing file and edit operation buttons"""
@@ -131,6 +850,15 @@ class LoadingImage:
             command=self.load_image
         )
         self.load_button.pack(side=tk.LEFT, padx=2)
+
+        # Open folder button - Shows the thumbnails of a folder next to the canvas
+        self.folder_button = ttk.Button(
+            self.file_group,
+            text="Open Folder",
+            style="Secondary.TButton",
+            command=self.open_folder
+        )
+        self.folder_button.pack(side=tk.LEFT, padx=2)
         
         # Save button - Initially disabled until image is cropped
         self.download_button = ttk.Button(
@@ -141,6 +869,16 @@ class LoadingImage:
             state=tk.DISABLED
         )
         self.download_button.pack(side=tk.LEFT, padx=2)
+
+        # Save sizes button - The crop at several widths and formats (one decode)
+        self.renditions_button = ttk.Button(
+            self.file_group,
+            text="Save Sizes",
+            style="Secondary.TButton",
+            command=self.save_renditions,
+            state=tk.DISABLED
+        )
+        self.renditions_button.pack(side=tk.LEFT, padx=2)
         
         # Edit operations section (Undo/Redo buttons)
         self.edit_group = ttk.LabelFrame(self.toolbar, text="Edit", padding="5")
@@ -163,6 +901,75 @@ class LoadingImage:
             command=self.redo_state
         )
         self.redo_button.pack(side=tk.LEFT, padx=2)
+
+        # Suggest button - Selects the suggested crop, undo goes back to the previous selection
+        self.suggest_button = ttk.Button(
+            self.edit_group,
+            text="Suggest Crop",
+            style="Secondary.TButton",
+            command=self.suggest_crop
+        )
+        self.suggest_button.pack(side=tk.LEFT, padx=2)
+
+        # Browse operations section (previous/next image of the folder)
+        self.browse_group = ttk.LabelFrame(self.toolbar, text="Browse", padding="5")
+        self.browse_group.pack(side=tk.LEFT, padx=5)
+
+        self.previous_button = ttk.Button(
+            self.browse_group,
+            text="◀ Previous",
+            style="Secondary.TButton",
+            command=lambda: self.show_neighbour(-1)
+        )
+        self.previous_button.pack(side=tk.LEFT, padx=2)
+
+        self.next_button = ttk.Button(
+            self.browse_group,
+            text="Next ▶",
+            style="Secondary.TButton",
+            command=lambda: self.show_neighbour(1)
+        )
+        self.next_button.pack(side=tk.LEFT, padx=2)
+
+        # Template operations section (save the selection as a template, crop many images with it)
+        self.template_group = ttk.LabelFrame(self.toolbar, text="Templates", padding="5")
+        self.template_group.pack(side=tk.LEFT, padx=5)
+
+        self.save_template_button = ttk.Button(
+            self.template_group,
+            text="Save Template",
+            style="Secondary.TButton",
+            command=self.save_selection_template
+        )
+        self.save_template_button.pack(side=tk.LEFT, padx=2)
+
+        self.apply_template_button = ttk.Button(
+            self.template_group,
+            text="Apply Template",
+            style="Secondary.TButton",
+            command=self.apply_template_to_files
+        )
+        self.apply_template_button.pack(side=tk.LEFT, padx=2)
+
+        # Region operations section (many crops from one image)
+        self.region_group = ttk.LabelFrame(self.toolbar, text="Regions", padding="5")
+        self.region_group.pack(side=tk.LEFT, padx=5)
+
+        self.add_region_button = ttk.Button(
+            self.region_group,
+            text="Add Region",
+            style="Secondary.TButton",
+            command=self.add_region
+        )
+        self.add_region_button.pack(side=tk.LEFT, padx=2)
+
+        self.export_regions_button = ttk.Button(
+            self.region_group,
+            text="Export Regions",
+            style="Secondary.TButton",
+            command=self.export_regions
+        )
+        self.export_regions_button.pack(side=tk.LEFT, padx=2)
         
     def create_status_bar(self):
         """Creates a status bar at the bottom of the window to display app state and messages"""
@@ -199,13 +1006,74 @@ class LoadingImage:
         self.canvas.bind("<ButtonPress-1>", self.on_mouse_press)
         self.canvas.bind("<B1-Motion>", self.on_mouse_drag)
         self.canvas.bind("<ButtonRelease-1>", self.on_mouse_release)
+
+        # Zoom with the mouse wheel (Windows/macOS send <MouseWheel>, X11 sends buttons 4 and 5)
+        self.canvas.bind("<MouseWheel>", self.on_mouse_wheel)
+        self.canvas.bind("<Button-4>", self.on_mouse_wheel)
+        self.canvas.bind("<Button-5>", self.on_mouse_wheel)
+
+        # Pan with the middle or right mouse button
+        for button in (2, 3):
+            self.canvas.bind(f"<ButtonPress-{button}>", self.on_pan_start)
+            self.canvas.bind(f"<B{button}-Motion>", self.on_pan_drag)
         
     def keybind_shortcuts(self):
         """keybiind keyboard shortcuts"""
         self.root.bind("<Control-z>", lambda e: self.undo_state()) # Undo last action
         self.root.bind("<Control-y>", lambda e: self.redo_state())
+        self.root.bind("<Control-g>", lambda e: self.suggest_crop()) # Select the suggested crop
         self.root.bind("<Control-s>", lambda e: self.download_cropped_image()) # Save image
         self.root.bind("<Control-o>", lambda e: self.load_image()) #load image
+        self.root.bind("<Control-O>", lambda e: self.open_folder()) # Ctrl+Shift+O thumbnails of a folder
+        self.root.bind("<Return>", lambda e: self.add_region()) # Keep the selection as a crop region
+        self.root.bind("<Delete>", lambda e: self.delete_selected_region())
+        self.root.bind("<Control-e>", lambda e: self.export_regions()) # Export every crop region
+        self.root.bind("<Control-m>", lambda e: self.toggle_live_mask()) # Live mask while dragging
+        self.root.bind("<Control-0>", lambda e: self.reset_zoom()) # Fit image in the window
+        self.root.bind("<Escape>", lambda e: self.cancel_loading()) # Cancel loading
+        self.root.bind("<Control-r>", lambda e: self.restore_last_session()) # Reopen the last session
+        self.root.bind("<Next>", lambda e: self.show_neighbour(1)) # Page Down: next image in the folder
+        self.root.bind("<Prior>", lambda e: self.show_neighbour(-1)) # Page Up: previous image
+        self.root.bind("<Control-I>", lambda e: self.toggle_profiling()) # Ctrl+Shift+I latency readout
+        self.root.bind("<Control-D>", lambda e: self.dump_profile()) # Ctrl+Shift+D dump histograms
+        self.root.bind("<Control-P>", lambda e: self.toggle_cprofile()) # Ctrl+Shift+P cProfile recording
+
+    """
+    Latency instrumentation. The event handlers are wrapped in __init__ and the steps inside them
+    are timed with self.profiler.stage(...). The dumps go to ~/.image_editor/profiles.
+    """
+    def toggle_profiling(self):
+        """Turn the instrumentation and the frame time readout in the status bar on or off"""
+        self.profiler.enabled = not self.profiler.enabled
+        if self.profiler.enabled:
+            self.update_profile_readout()
+        else:
+            if self._readout_job is not None:
+                self.root.after_cancel(self._readout_job)
+                self._readout_job = None
+            self.update_status("Profiling off")
+
+    def update_profile_readout(self):
+        """Show the live frame time readout a few times per second"""
+        self.update_status(self.profiler.frame_summary())
+        self._readout_job = self.root.after(250, self.update_profile_readout)
+
+    def profile_path(self, extension):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        return os.path.join(self.profile_dir, time.strftime("profile_%Y%m%d_%H%M%S") + extension)
+
+    def dump_profile(self):
+        """Write the latency histograms as JSON"""
+        try:
+            path = self.profiler.dump_json(self.profile_path(".json"))
+            self.update_status(f"Latency data written to: {path}")
+        except OSError as e:
+            self.update_status(f"Error writing latency data: {str(e)}")
+
+    def toggle_cprofile(self):
+        """Start a cProfile recording, or stop it and write the .prof file"""
+        path = self.profiler.toggle_cprofile(self.profile_path(".prof"))
+        self.update_status(f"cProfile written to: {path}" if path else "cProfile recording... (Ctrl+Shift+P to stop)")
         
     """
     The methods in this section loads the image and display it in the tkinter GUI window 
@@ -224,54 +1092,323 @@ class LoadingImage:
 
         # Process selected image if user didn't cancel
         if file_path:
+            self.open_image(file_path)
+
+    def open_image(self, file_path):
+        """Load an image in the background (or from the cache) and display it when it is ready"""
+        if file_path:
+            file_path = os.path.abspath(file_path)
+            self.tasks.cancel("full_decode")
+
+            # Already decoded (opened before or prefetched), show it straight away
+            cached = self.image_cache.get(file_path)
+            if cached is not None:
+                self.tasks.cancel("load")
+                self.pending_open = None
+                self.on_image_loaded(cached, 0.0)
+                return
+
             self.update_status(f"Loading image: {os.path.basename(file_path)}...") # Display the image name in the status bar
-            # Attempt to load and display the image
-            if self.processor.load_image(file_path):
+            if file_path in self.prefetching.values():
+                # A prefetch of this image is already running, show it when it finishes
+                self.tasks.cancel("load")
+                self.pending_open = file_path
+                return
+
+            # Prefetched neighbours of the previous image are not needed any more, the new image queues its own
+            for slot in self.prefetching:
+                self.prefetch_tasks.cancel(slot)
+            self.prefetching.clear()
+
+            # Decode in the background, a newer load supersedes this one
+            self.pending_open = None
+            preview_size = self.preview_decode_size()
+            self.tasks.submit("load", f"Loading image: {os.path.basename(file_path)}",
+                              lambda: self.decode_for_display(file_path, preview_size),
+                              self.on_image_loaded, self.on_load_failed)
+
+    def preview_decode_size(self):
+        """Only decode a preview big enough for the canvas, the full image is decoded when it is needed"""
+        return (max(self.canvas.winfo_width(), 256), max(self.canvas.winfo_height(), 256))
+
+    def decode_for_display(self, file_path, preview_size=None):
+        """Decode an image and build its pyramid (runs on a worker thread). Returns (processor, pyramid)"""
+        processor = ProcessImage()
+        with self.profiler.stage("decode_preview" if preview_size else "decode_full"):
+            loaded = processor.load_image(file_path, max_size=preview_size)
+        if not loaded:
+            raise ValueError(processor.last_error or "Failed to load image")
+        with self.profiler.stage("pyramid"):
+            pyramid = ImagePyramid(processor.current_image, full_size=processor.full_size,
+                                   base_factor=1 / processor.reduction)
+        return processor, pyramid
+
+    def on_image_loaded(self, result, elapsed):
+        """Show an image that finished loading in the background"""
+        self.processor, self.pyramid = result # The pyramid is built once, used by every redraw
+        self.original_image = self.processor.get_current_image()
+        self.image_cache.put(self.processor.current_image_path, self.processor, self.pyramid)
+        # A new image starts without a selection and fitted in the window
+        self.mapping = None
+        self.start_x = self.start_y = self.end_x = self.end_y = None
+        self.cropped_image = None
+        self.zoom = 1.0
+        self.view_center = None
+        self.redraw_rectangle() # Hides the selection of the previous image
+        self.clear_regions() # Regions belong to the previous image
+        self.region_index = RegionIndex(self.pyramid.width, self.pyramid.height)
+        self.display_image() # Display the loaded image
+        self.open_history(self.processor.current_image_path) # Brings back the journaled selection history
+        self.update_status(f"Image loaded successfully ({elapsed:.2f}s)")
+        self.prefetch_neighbours()
+        self.show_thumbnails(os.path.dirname(self.processor.current_image_path))
+
+    """
+    Browsing the folder of the current image. Page Down/Page Up (or the toolbar buttons) open the next
+    and previous image. Decoded images stay in an LRU cache (ImageCache) and the neighbours of the current
+    image are decoded in the background before they are needed, so moving to the next image is instant.
+    """
+    def folder_images(self, folder):
+        """Sorted image files of a folder (the listing is kept until another folder is opened)"""
+        if folder != self.folder_path:
+            try:
+                names = sorted(os.listdir(folder), key=str.lower)
+            except OSError:
+                names = []
+            self.folder_path = folder
+            self.folder_listing = [os.path.join(folder, name) for name in names if name.lower().endswith(IMAGE_EXTENSIONS)]
+        return self.folder_listing
+
+    def neighbour_path(self, step):
+        """Path of the image step places away from the current one in its folder, or None"""
+        current = self.processor.current_image_path
+        if not current:
+            return None
+        images = self.folder_images(os.path.dirname(current))
+        if current not in images:
+            return None
+        index = images.index(current) + step
+        return images[index] if 0 <= index < len(images) else None
+
+    def show_neighbour(self, step):
+        """Open the next (step=1) or previous (step=-1) image of the folder"""
+        path = self.neighbour_path(step)
+        if path is None:
+            self.update_status("No more images in this folder")
+            return
+        self.open_image(path)
+
+    def open_folder(self):
+        """Pick a folder and show its thumbnails, an image is opened by clicking it"""
+        folder = filedialog.askdirectory(title="Open Folder")
+        if folder:
+            self.show_thumbnails(folder)
+            self.update_status(f"{len(self.folder_images(folder))} images in {folder}")
+
+    def show_thumbnails(self, folder):
+        self.thumbnail_strip.show_folder(folder, self.folder_images(folder), self.processor.current_image_path)
+
+    def prefetch_neighbours(self):
+        """Decode the next and previous images in the background so they are cached before they are opened"""
+        preview_size = self.preview_decode_size()
+        for step, slot in ((1, "prefetch:next"), (-1, "prefetch:previous")):
+            path = self.neighbour_path(step)
+            if path is None or path in self.image_cache:
+                self.prefetch_tasks.cancel(slot)
+                self.prefetching.pop(slot, None)
+                continue
+            if self.prefetching.get(slot) == path and self.prefetch_tasks.is_running(slot):
+                continue # Already on its way
+
+            def on_done(result, elapsed, slot=slot, path=path):
+                self.prefetching.pop(slot, None)
+                self.image_cache.put(path, *result)
+                if self.pending_open == path:
+                    # The user already asked for this image
+                    self.pending_open = None
+                    self.on_image_loaded(result, elapsed)
+
+            def on_error(error, slot=slot, path=path):
+                self.prefetching.pop(slot, None)
+                if self.pending_open == path:
+                    self.pending_open = None
+                    self.on_load_failed(error)
+
+            # A newer prefetch for the same slot supersedes this one, quiet task (no description)
+            self.prefetching[slot] = path
+            self.prefetch_tasks.submit(slot, None, lambda path=path: self.decode_for_display(path, preview_size),
+                                       on_done, on_error)
+
+    def on_load_failed(self, error):
+        self.update_status("Failed to load image")
+        messagebox.showerror("Error", f"Unexpected error while loading image: {str(error)}")
+
+    def cancel_loading(self):
+        """Cancel the image that is loading, the current image stays on screen"""
+        if self.tasks.cancel("load"):
+            self.update_status("Loading cancelled")
+
+    def show_progress(self, description, elapsed):
+        """Show a running background task and its elapsed time in the status bar"""
+        self.update_status(f"{description}... {elapsed:.1f}s")
+
+    def decode_full_resolution(self):
+        """Replace the preview with the full resolution image once it is decoded"""
+        image_path = self.processor.current_image_path
+
+        def on_done(result, elapsed):
+            if result[0].current_image_path == self.processor.current_image_path:
+                self.processor, self.pyramid = result
                 self.original_image = self.processor.get_current_image()
-                self.display_image() # Display the loaded image
-                self.update_status("Image loaded successfully")
-            else:
-                self.update_status("Failed to load image")
+                self.image_cache.put(image_path, self.processor, self.pyramid)
+                self.display_image()
+                self.update_status(f"Full resolution image ready ({elapsed:.2f}s)")
 
-    def display_image(self):
-        """Display the currently loaded image"""
-        if self.processor.current_image is not None:
-            image = Image.fromarray(self.processor.current_image)  # Convert OpenCV image to PIL Image 
+        self.tasks.submit("full_decode", "Decoding full resolution image", lambda: self.decode_for_display(image_path),
+                          on_done, self.on_load_failed)
 
+    def display_image(self):
+        """Display the visible part of the currently loaded image at the current zoom and pan"""
+        if self.pyramid is not None:
             # get the current window size 
             canvas_width = self.canvas.winfo_width()
             canvas_height = self.canvas.winfo_height()
             
-            # Calculate scaling factor to fit window while maintaining the same asepct ratio 
-            img_width, img_height = image.size
-            width_ratio = canvas_width / img_width
-            height_ratio = canvas_height / img_height
-            scale_factor = min(width_ratio, height_ratio)
-            
-            # calculate the new dimesion 
-            new_width = int(img_width * scale_factor)
-            new_height = int(img_height * scale_factor)
-            
-            # Resize image
-            image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            
+            # Calculate scaling factor to fit window while maintaining the same asepct ratio, then apply the zoom
+            img_width, img_height = self.pyramid.width, self.pyramid.height
+            fit_scale = min(canvas_width / img_width, canvas_height / img_height)
+            scale_factor = fit_scale * self.zoom
+
+            # Zoomed in further than the preview resolution: a tiled image reads the view from its tiles,
+            # otherwise the full image is decoded in the background
+            use_tiles = self.processor.tiled is not None and not self.pyramid.has_resolution_for(scale_factor)
+            if not self.pyramid.has_resolution_for(scale_factor) and not self.processor.is_full_resolution() \
+                    and self.processor.tiled is None and not self.tasks.is_running("full_decode"):
+                self.decode_full_resolution()
+
+            # Keep the view inside the image, a smaller image than the canvas is centred
+            if self.view_center is None:
+                self.view_center = (img_width / 2, img_height / 2)
+            center_x = self.clamp_view(self.view_center[0], img_width, canvas_width / scale_factor)
+            center_y = self.clamp_view(self.view_center[1], img_height, canvas_height / scale_factor)
+            self.view_center = (center_x, center_y)
+
+            # Canvas position of the source origin
+            x_offset = round(canvas_width / 2 - center_x * scale_factor)
+            y_offset = round(canvas_height / 2 - center_y * scale_factor)
+
+            # Resample only the visible viewport from the nearest pyramid level (into the previous view buffer)
+            with self.profiler.stage("resize_view"):
+                renderer = self.processor.tiled if use_tiles else self.pyramid
+                view, view_x, view_y = renderer.render(scale_factor, x_offset, y_offset, canvas_width, canvas_height,
+                                                       out=self.processed_image)
+            if view is None:
+                return
+
             # Store processed image for later use
-            self.processed_image = np.array(image)  
+            self.processed_image = view
 
-            # Convert to Tkinter-compatible format
-            self.photo_image = ImageTk.PhotoImage(image)
-        
-            # Center the image on canvas
-            x_offset = (canvas_width - new_width) // 2
-            y_offset = (canvas_height - new_height) // 2
-            
-            # Clear previous content and display new image
-            self.canvas.delete("all")
-            self.canvas.create_image(x_offset, y_offset, image=self.photo_image, anchor=tk.NW)
+            # Convert to Tkinter-compatible format (the dimmed frame for the mask is cached here as well)
+            with self.profiler.stage("photoimage"):
+                self.compositor.prepare(self.processed_image)
+
+            # Remember where the selection was on the source before the layout changes
+            selection = self.selection_in_source()
+
+            # Record the scale and offsets so selections can be mapped back to source pixels
+            self.mapping = DisplayMapping(scale_factor, x_offset, y_offset, img_width, img_height, view_x, view_y)
+
+            # Display the new image, the canvas item is reused and stays below the selection
+            with self.profiler.stage("canvas"):
+                if self.image_item is None:
+                    self.image_item = self.canvas.create_image(view_x, view_y, image=self.compositor.frame, anchor=tk.NW)
+                    self.canvas.tag_lower(self.image_item)
+                else:
+                    self.canvas.coords(self.image_item, view_x, view_y)
+                    self.canvas.itemconfigure(self.image_item, image=self.compositor.frame)
+
+            # Keep the selection and the regions attached to the same source pixels after a resize, zoom or pan
+            if selection is not None:
+                self.set_selection_from_source(selection)
+                self.apply_selection_mask()
+            self.redraw_regions()
+
+    def clamp_view(self, center, image_size, visible_size):
+        """Clamp a view centre so the view does not scroll past the image edges"""
+        if visible_size >= image_size:
+            return image_size / 2
+        return min(max(center, visible_size / 2), image_size - visible_size / 2)
+
+    def selection_in_source(self):
+        """Return the selection in source coordinates, or None when there is no selection"""
+        if self.mapping is None or None in (self.start_x, self.start_y, self.end_x, self.end_y):
+            return None
+        canvas_selection = (self.start_x, self.start_y, self.end_x, self.end_y)
+        if self._source_selection is not None and self._source_selection[0] == canvas_selection:
+            # Selection did not move since it was placed, reuse the exact value to avoid rounding drift
+            return self._source_selection[1]
+        return self.mapping.canvas_to_source(self.start_x, self.start_y) + self.mapping.canvas_to_source(self.end_x, self.end_y)
+
+    def set_selection_from_source(self, selection):
+        """Place the selection on the canvas from source coordinates"""
+        self.start_x, self.start_y = self.mapping.source_to_canvas(selection[0], selection[1])
+        self.end_x, self.end_y = self.mapping.source_to_canvas(selection[2], selection[3])
+        self._source_selection = ((self.start_x, self.start_y, self.end_x, self.end_y), tuple(selection))
+
+    def schedule_display(self):
+        """Redraw the view once all pending zoom/pan events have been handled"""
+        if self._display_job is None:
+            self._display_job = self.root.after_idle(self.run_scheduled_display)
+
+    def run_scheduled_display(self):
+        self._display_job = None
+        self.display_image()
+
+    def on_mouse_wheel(self, event):
+        """Zoom in or out around the mouse cursor"""
+        if self.mapping is None:
+            return
+        zoom_in = event.num == 4 or getattr(event, "delta", 0) > 0
+        factor = 1.25 if zoom_in else 0.8
+        max_zoom = max(1.0, self.max_pixel_zoom * self.zoom / self.mapping.scale)
+        new_zoom = min(max(self.zoom * factor, 1.0), max_zoom)
+        if new_zoom == self.zoom:
+            return
+
+        # Keep the source point under the cursor fixed
+        source_x, source_y = self.mapping.canvas_to_source(event.x, event.y)
+        new_scale = self.mapping.scale * new_zoom / self.zoom
+        canvas_width = self.canvas.winfo_width()
+        canvas_height = self.canvas.winfo_height()
+        self.view_center = (source_x - (event.x - canvas_width / 2) / new_scale,
+                            source_y - (event.y - canvas_height / 2) / new_scale)
+        self.zoom = new_zoom
+        self.schedule_display()
+        self.update_status(f"Zoom: {new_scale * 100:.0f}%")
+
+    def on_pan_start(self, event):
+        """Remember where panning started"""
+        self._pan_start = (event.x, event.y)
+
+    def on_pan_drag(self, event):
+        """Move the view with the mouse"""
+        if self.mapping is None or self._pan_start is None:
+            return
+        dx, dy = event.x - self._pan_start[0], event.y - self._pan_start[1]
+        self._pan_start = (event.x, event.y)
+        self.view_center = (self.view_center[0] - dx / self.mapping.scale,
+                            self.view_center[1] - dy / self.mapping.scale)
+        self.schedule_display()
+
+    def reset_zoom(self):
+        """Fit the whole image in the window again"""
+        self.zoom = 1.0
+        self.view_center = None
+        self.display_image()
     
     def handle_resize(self, event=None):
         """Handle window resize events by updating the image display"""
-        if hasattr(self, 'processor') and self.processor.current_image is not None:
+        if hasattr(self, 'processor') and self.pyramid is not None:
             # Add small delay to prevent rapid redraws during resizing
             if hasattr(self, "_resize_job"):
                 self.root.after_cancel(self._resize_job)
@@ -288,44 +1425,34 @@ class LoadingImage:
     *Applying Dark Effect outside the selected area*
     
     This function darkens everything outside the selected area while keeping the selected part normal. 
-    It firstly check if an image is loaded or not and then it makes a copy of it to add a black overlay.
-    The black overlay is slightly transparent and we choose it to make it 60%.
-    After this the image looks darker and the selected ares is cleared by replacing it with the orginal image.
-    Finally, the updated image is shown on the Tkinter canvas, and the selection box is redrawn.
+    It firstly check if an image is loaded or not. The black overlay is slightly transparent and we choose it to make it 60%.
+    The dimmed copy of the image is only made once when the image is displayed (see MaskCompositor), so when the
+    selection changes only the old rectangle is dimmed again and the new one is cleared by copying the orginal image.
+    Finally, the selection box is redrawn.
     
     """
     def apply_selection_mask(self): 
         """Apply a dark mask to unselected areas and redraw the selection with handles."""
-        if self.original_image is None or None in (self.start_x, self.start_y, self.end_x, self.end_y):
+        if self.original_image is None or self.mapping is None or None in (self.start_x, self.start_y, self.end_x, self.end_y):
             return
         
         try:
-            image = self.processed_image.copy() # Create working copy of the image
-            h, w, _ = image.shape
-
-            # Create a dark overlay
-            overlay = np.zeros((h, w, 3), dtype=np.uint8)
-            overlay[:] = (0, 0, 0)  # Black overlay
-
-            # Apply transparency to the overlay
-            alpha = 0.6 # 60% transparency
-            blended = cv2.addWeighted(image, 1 - alpha, overlay, alpha, 0) # Blend overlay with original image
+            h, w, _ = self.processed_image.shape
  
-            # Keep the selected region clear
-            x1, x2 = sorted([self.start_x, self.end_x])
-            y1, y2 = sorted([self.start_y, self.end_y])
-            blended[y1:y2, x1:x2] = image[y1:y2, x1:x2]
-
-            self.cropped_image = image[y1:y2, x1:x2]  # Save cropped image for download
+            # Keep the selected region clear (selection is in canvas coordinates, the image is drawn at an offset)
+            x1, y1, x2, y2 = self.mapping.selection_to_display(self.start_x, self.start_y, self.end_x, self.end_y, w, h)
+            with self.profiler.stage("mask"):
+                self.compositor.set_selection(x1, y1, x2, y2)
 
-            # Convert and display the masked image
-            masked_image = Image.fromarray(blended)
-            self.photo_image = ImageTk.PhotoImage(masked_image)
-            self.canvas.create_image(0, 0, image=self.photo_image, anchor=tk.NW)
+            self.cropped_image = self.processed_image[y1:y2, x1:x2]  # Display sized crop, only used for the preview
+            if x2 > x1 and y2 > y1:
+                self.resize_preview(self.resize_slider.get()) # Refresh the preview of the crop
 
             # Redraw the selection rectangle with handles
-            self.redraw_rectangle()
+            with self.profiler.stage("canvas"):
+                self.redraw_rectangle()
             self.download_button.config(state=tk.NORMAL)  # Enable download button
+            self.renditions_button.config(state=tk.NORMAL)
             
         except Exception as e:
             self.update_status(f"Error applying mask: {str(e)}")
@@ -334,61 +1461,84 @@ class LoadingImage:
     *Selection Box Drawing in Rectangle*
     
     This function is helpful to darw a blue rectange around the selected area in all four rectangles sides
-    which will be helpful to adjust the selection area from each side. Firslty, it removes an old shapes becuase it will creat a pattern of redrwing otherwise and checks if the selection area exists and olny draw the rectangle.
-    It also calculate the center points of each side of the rectange and places four small handles to make resizing the cropping image easier.
+    which will be helpful to adjust the selection area from each side. The rectangle and the handles are created once
+    and then only moved with canvas.coords() (or hidden when there is no selection), creating and deleting canvas items
+    on every mouse motion was the slowest part of dragging.
+    The handle positions come from SELECTION_HANDLES, which is also used to find the handle under the mouse and the
+    edges it moves, so a new handle (for example a corner) only has to be added there.
     
     """
-    def redraw_rectangle(self):
-        """Redraw the rectangle with small square handles at the center of each side."""
-        # Delete previously drawn rectangle & handles
-        for shape in self.drawn_shapes:
-            self.canvas.delete(shape) # Delete the shape
-        self.drawn_shapes.clear() # Clear the shapes
-
-        if None not in (self.start_x, self.start_y, self.end_x, self.end_y): # Check if selection exists
-            # Draw selection rectangle
-            rect = self.canvas.create_rectangle( # Draw rectangle around the selected area
-                self.start_x, self.start_y, 
-                self.end_x, self.end_y, 
-                outline="#2196F3", 
-                width=2, 
-                dash=(5, 2)  # Dashed line for better visibility
-            )
-            self.drawn_shapes.append(rect) # Append the rectangle to the shapes
-
-            self.add_handles()
-            
-    def add_handles(self):
-        handle_size = 6  # Size of the square handles
+    HANDLE_SIZE = 6 # Half the size of the square handles
 
-        # Compute center positions for each side
-        mid_x = (self.start_x + self.end_x) // 2
-        mid_y = (self.start_y + self.end_y) // 2
+    # Handle name -> (position between start_x and end_x, position between start_y and end_y, edges it moves)
+    SELECTION_HANDLES = {
+        "top": (0.5, 0.0, ("start_y",)),
+        "bottom": (0.5, 1.0, ("end_y",)),
+        "left": (0.0, 0.5, ("start_x",)),
+        "right": (1.0, 0.5, ("end_x",))
+    }
 
-        # Define handle positions for each edge
-        self.handle_positions = {
-            "top": (mid_x, self.start_y),
-            "bottom": (mid_x, self.end_y),
-            "left": (self.start_x, mid_y),
-            "right": (self.end_x, mid_y)
-        }
-        
-        # Create handles with better visual style
-        for position, (x, y) in self.handle_positions.items(): # Loop through each handle position
+    def create_selection_items(self):
+        """Create the (hidden) selection rectangle and handles the first time they are needed"""
+        if self.selection_rect is not None:
+            return
+        self.selection_rect = self.canvas.create_rectangle(
+            0, 0, 0, 0,
+            outline="#2196F3", 
+            width=2, 
+            dash=(5, 2),  # Dashed line for better visibility
+            state=tk.HIDDEN
+        )
+        self.drawn_shapes.append(self.selection_rect)
+        for name in self.SELECTION_HANDLES:
             handle = self.canvas.create_rectangle(
-                x - handle_size, y - handle_size,
-                x + handle_size, y + handle_size,
+                0, 0, 0, 0,
                 fill="#2196F3",  # Material Design Blue
                 outline="white",
-                width=1
+                width=1,
+                state=tk.HIDDEN
             )
+            self.handle_items[name] = handle
             self.drawn_shapes.append(handle)
 
+    def set_selection_visible(self, visible):
+        """Show or hide the rectangle and handles (only touches the canvas when the visibility changes)"""
+        if visible != self.selection_visible:
+            for shape in self.drawn_shapes:
+                self.canvas.itemconfigure(shape, state=tk.NORMAL if visible else tk.HIDDEN)
+            self.selection_visible = visible
+
+    def redraw_rectangle(self):
+        """Move the rectangle and the small square handles to the current selection."""
+        self.create_selection_items()
+        if None in (self.start_x, self.start_y, self.end_x, self.end_y): # Check if selection exists
+            self.handle_positions = {}
+            self.set_selection_visible(False)
+            return
+
+        # Move the selection rectangle around the selected area
+        self.canvas.coords(self.selection_rect, self.start_x, self.start_y, self.end_x, self.end_y)
+        self.add_handles()
+        self.set_selection_visible(True)
+            
+    def update_handle_positions(self):
+        """Compute the centre of every handle from the selection"""
+        self.handle_positions = {
+            name: (round(self.start_x + (self.end_x - self.start_x) * fx), round(self.start_y + (self.end_y - self.start_y) * fy))
+            for name, (fx, fy, _) in self.SELECTION_HANDLES.items()
+        }
+
+    def add_handles(self):
+        """Move the handles to their positions on the selection"""
+        size = self.HANDLE_SIZE
+        self.update_handle_positions()
+        for name, (x, y) in self.handle_positions.items(): # Loop through each handle position
+            self.canvas.coords(self.handle_items[name], x - size, y - size, x + size, y + size)
+
     def detect_handle(self, x, y): # This function checks if you clicked on a resize handle or not and if you click then it will atjust or
-        handle_size = 6 # Size of the square handles
         # Check each handle's detection area
         for handle, (hx, hy) in self.handle_positions.items():
-            if abs(x - hx) <= handle_size and abs(y - hy) <= handle_size: # Check if clicked on handle
+            if abs(x - hx) <= self.HANDLE_SIZE and abs(y - hy) <= self.HANDLE_SIZE: # Check if clicked on handle
                 return handle # Return the handle name if clicked
         return None # Return None if not clicked on handle
     
@@ -402,15 +1552,10 @@ class LoadingImage:
     """
     
     def adjust_rectangle(self, x, y):
-        # Adjust the appropriate edge based on which handle is being dragged 
-        if self.active_handle == "top":
-            self.start_y = y # Move top edge vertically
-        elif self.active_handle == "bottom":
-            self.end_y = y # Move bottom edge vertically  
-        elif self.active_handle == "left":
-            self.start_x = x # Move left edge horizontally
-        elif self.active_handle == "right":
-            self.end_x = x  # Move right edge horizontally
+        # Adjust the edges the dragged handle moves (x edges follow the mouse horizontally, y edges vertically)
+        if self.active_handle in self.SELECTION_HANDLES:
+            for edge in self.SELECTION_HANDLES[self.active_handle][2]:
+                setattr(self, edge, x if edge.endswith("_x") else y)
 
     """ 
     *On Mouse Selection Handling*
@@ -423,6 +1568,18 @@ class LoadingImage:
         """Store the initial position of the mouse when clicked."""
         # Check if click is on a resize handle
         self.active_handle = self.detect_handle(event.x, event.y) # Detect handle if clicked
+
+        # A region handle resizes that region and dragging inside the selected region moves it. Dragging inside
+        # another region starts a new selection as usual, a click without dragging selects that region
+        self.region_click = None
+        if self.active_handle is None and self.regions:
+            region_id, handle = self.region_hit(event.x, event.y)
+            if region_id is not None and (handle is not None or region_id == self.selected_region):
+                self.select_region(region_id)
+                self.region_drag = (region_id, handle, self.mapping.canvas_to_source(event.x, event.y), self.regions[region_id])
+                return
+            if region_id is not None:
+                self.region_click = (region_id, event.x, event.y, (self.start_x, self.start_y, self.end_x, self.end_y))
         
         if self.active_handle is None:
             # Start new selection if not clicking a handle
@@ -433,151 +1590,552 @@ class LoadingImage:
 
     def on_mouse_drag(self, event):
         """Draw a rectangle as the mouse is dragged, updating dynamically."""
+        if self.region_drag is not None:
+            self.drag_region(event.x, event.y)
+            return
+        if self.region_click is not None:
+            if max(abs(event.x - self.region_click[1]), abs(event.y - self.region_click[2])) <= self.CLICK_SLOP:
+                return # Still a click
+            self.region_click = None # Dragging, this is a new selection
         if self.active_handle: # Check if handle is active
             # Resize using handle
             self.adjust_rectangle(event.x, event.y) # Adjust rectangle based on handle
         else:
             # Update selection size
             self.end_x, self.end_y = event.x, event.y # Update end coordinates
-        self.redraw_rectangle() # Redraw the rectangle
+        self.schedule_drag_redraw() # Redraw the rectangle on the next frame
+
+    def schedule_drag_redraw(self):
+        """Merge bursts of motion events so there is at most one redraw per display frame"""
+        if self._drag_job is not None:
+            return # A redraw is already pending and will use the latest coordinates
+        elapsed = (time.perf_counter() - self._last_drag_redraw) * 1000
+        delay = int(self.frame_interval - elapsed)
+        if delay > 0:
+            self._drag_job = self.root.after(delay, self.redraw_drag)
+        else:
+            self._drag_job = self.root.after_idle(self.redraw_drag)
+
+    def redraw_drag(self):
+        """Redraw the selection while dragging, with the live mask only the changed strips are repainted"""
+        self._drag_job = None
+        self._last_drag_redraw = time.perf_counter()
+        if self.live_mask and self.mapping is not None and self.processed_image is not None \
+                and None not in (self.start_x, self.start_y, self.end_x, self.end_y):
+            h, w, _ = self.processed_image.shape
+            with self.profiler.stage("mask"):
+                self.compositor.set_selection(*self.mapping.selection_to_display(self.start_x, self.start_y, self.end_x, self.end_y, w, h))
+        with self.profiler.stage("canvas"):
+            self.redraw_rectangle()
+
+    def toggle_live_mask(self):
+        """Switch the live mask preview during drags on or off"""
+        self.live_mask = not self.live_mask
+        self.update_status(f"Live mask preview {'on' if self.live_mask else 'off'}")
 
     def on_mouse_release(self, event):
         """Apply the selection mask when the mouse is released."""
+        if self._drag_job is not None:
+            # Flush the pending redraw so the final position is drawn
+            self.root.after_cancel(self._drag_job)
+            self.redraw_drag()
+        if self.region_drag is not None:
+            self.finish_region_drag()
+            return
+        if self.region_click is not None:
+            # A click on a region selects it and keeps the selection as it was
+            region_id, _, _, (self.start_x, self.start_y, self.end_x, self.end_y) = self.region_click
+            self.region_click = None
+            self.select_region(region_id)
+            return
+        handle = self.active_handle
         self.active_handle = None  # Reset active handle state
         if None not in (self.start_x, self.start_y, self.end_x, self.end_y): # Check if selection exists
-            self.save_state()  # Save state before applying mask
+            self.save_state(handle)  # Save state before applying mask
             self.apply_selection_mask() # Apply the dark mask
 
     """
-    This function download the cropped image in the same folder in which the program is running. 
-    It first checks to see if the cropped image exists or not and then gets the current folder path using 
-    os library and the image is saved as the name given "cropped_image.png"
+    Multiple crop regions. The selection is added to the regions with Enter (or Add Region), so many crops
+    can be cut from one contact sheet or scan. Every region has its own rectangle and handles: dragging a
+    handle resizes it, a click selects it, dragging inside the selected one moves it and Delete removes it.
+    Dragging inside a region that is not selected starts a new selection. Regions are kept in
+    source pixels and listed in a RegionIndex grid, so a click only tests the regions near the mouse.
+    Export Regions decodes the source once and writes all regions in parallel.
+    """
+    REGION_EDGES = {"start_x": 0, "start_y": 1, "end_x": 2, "end_y": 3} # Selection edge -> index in a region box
+    CLICK_SLOP = 3 # Canvas pixels the mouse may move during a click on a region
+
+    def add_region(self):
+        """Add the current selection to the crop regions"""
+        if self.mapping is None or None in (self.start_x, self.start_y, self.end_x, self.end_y):
+            self.update_status("Select an area before adding a region")
+            return
+        box = self.mapping.selection_to_source(self.start_x, self.start_y, self.end_x, self.end_y)
+        if box[2] <= box[0] or box[3] <= box[1]:
+            self.update_status("Selection is outside the image")
+            return
+        region_id = self.next_region_id
+        self.next_region_id += 1
+        self.regions[region_id] = box
+        self.region_index.insert(region_id, box)
+        self.create_region_items(region_id)
+        self.select_region(region_id)
+        # The active selection stays on top of the regions
+        for shape in self.drawn_shapes:
+            self.canvas.tag_raise(shape)
+        self.update_status(f"Region {region_id + 1} added ({len(self.regions)} regions)")
+
+    def create_region_items(self, region_id):
+        rectangle = self.canvas.create_rectangle(0, 0, 0, 0, outline="#FF9800", width=2)
+        handles = {
+            name: self.canvas.create_rectangle(0, 0, 0, 0, fill="#FF9800", outline="white", width=1)
+            for name in self.SELECTION_HANDLES
+        }
+        label = self.canvas.create_text(0, 0, anchor=tk.NW, text=str(region_id + 1), fill="#FF9800",
+                                        font=("Helvetica", 9, "bold"))
+        self.region_items[region_id] = (rectangle, handles, label)
+        self.redraw_region(region_id)
+
+    def region_canvas_box(self, region_id):
+        x1, y1, x2, y2 = self.regions[region_id]
+        return self.mapping.source_to_canvas(x1, y1) + self.mapping.source_to_canvas(x2, y2)
+
+    def region_handle_positions(self, region_id):
+        """Canvas centre of every handle of a region (same layout as the selection handles)"""
+        x1, y1, x2, y2 = self.region_canvas_box(region_id)
+        return {
+            name: (round(x1 + (x2 - x1) * fx), round(y1 + (y2 - y1) * fy))
+            for name, (fx, fy, _) in self.SELECTION_HANDLES.items()
+        }
+
+    def redraw_region(self, region_id):
+        """Move the items of a region to its box on the canvas"""
+        rectangle, handles, label = self.region_items[region_id]
+        x1, y1, x2, y2 = self.region_canvas_box(region_id)
+        size = self.HANDLE_SIZE
+        self.canvas.coords(rectangle, x1, y1, x2, y2)
+        self.canvas.itemconfigure(rectangle, width=3 if region_id == self.selected_region else 2)
+        for name, (x, y) in self.region_handle_positions(region_id).items():
+            self.canvas.coords(handles[name], x - size, y - size, x + size, y + size)
+        self.canvas.coords(label, min(x1, x2) + 4, min(y1, y2) + 2)
+
+    def redraw_regions(self):
+        if self.mapping is None:
+            return
+        for region_id in self.regions:
+            self.redraw_region(region_id)
+
+    def region_hit(self, x, y):
+        """Return (region id, handle name) under a canvas point; handle is None inside a region"""
+        if self.mapping is None or self.region_index is None:
+            return None, None
+        source_x, source_y = self.mapping.canvas_to_source(x, y)
+        candidates = self.region_index.query(source_x, source_y, self.HANDLE_SIZE / self.mapping.scale)
+        for region_id in candidates:
+            for name, (hx, hy) in self.region_handle_positions(region_id).items():
+                if abs(x - hx) <= self.HANDLE_SIZE and abs(y - hy) <= self.HANDLE_SIZE:
+                    return region_id, name
+        inside = self.region_index.query(source_x, source_y) & candidates
+        if inside:
+            # The smallest region wins, so a region nested in a bigger one can still be picked
+            def area(region_id):
+                x1, y1, x2, y2 = self.regions[region_id]
+                return abs(x2 - x1) * abs(y2 - y1)
+            return min(inside, key=area), None
+        return None, None
+
+    def select_region(self, region_id):
+        previous, self.selected_region = self.selected_region, region_id
+        for changed in (previous, region_id):
+            if changed in self.region_items:
+                self.canvas.itemconfigure(self.region_items[changed][0], width=3 if changed == region_id else 2)
+
+    def drag_region(self, x, y):
+        """Resize (handle) or move (inside) the region being dragged"""
+        region_id, handle, (start_x, start_y), box = self.region_drag
+        source_x, source_y = self.mapping.canvas_to_source(x, y)
+        if handle is not None:
+            box = list(box)
+            for edge in self.SELECTION_HANDLES[handle][2]:
+                box[self.REGION_EDGES[edge]] = source_x if edge.endswith("_x") else source_y
+        else:
+            # Move the whole region, but keep it inside the image
+            x1, y1, x2, y2 = box
+            dx = min(max(source_x - start_x, -x1), self.mapping.source_width - x2)
+            dy = min(max(source_y - start_y, -y1), self.mapping.source_height - y2)
+            box = [x1 + dx, y1 + dy, x2 + dx, y2 + dy]
+        self.regions[region_id] = tuple(box)
+        self.redraw_region(region_id)
+
+    def finish_region_drag(self):
+        """Store the dragged region as a sorted box in whole source pixels and update the index"""
+        region_id = self.region_drag[0]
+        self.region_drag = None
+        x1, y1, x2, y2 = self.regions[region_id]
+        width, height = self.mapping.source_width, self.mapping.source_height
+        x1, x2 = sorted((min(max(int(round(x1)), 0), width), min(max(int(round(x2)), 0), width)))
+        y1, y2 = sorted((min(max(int(round(y1)), 0), height), min(max(int(round(y2)), 0), height)))
+        if x2 <= x1 or y2 <= y1:
+            self.delete_region(region_id) # Dragged down to nothing
+            return
+        self.regions[region_id] = (x1, y1, x2, y2)
+        self.region_index.update(region_id, (x1, y1, x2, y2))
+        self.redraw_region(region_id)
+
+    def delete_region(self, region_id):
+        rectangle, handles, label = self.region_items.pop(region_id)
+        self.canvas.delete(rectangle, label, *handles.values())
+        del self.regions[region_id]
+        self.region_index.remove(region_id)
+        if self.selected_region == region_id:
+            self.selected_region = None
+
+    def delete_selected_region(self):
+        if self.selected_region is not None:
+            region_id = self.selected_region
+            self.delete_region(region_id)
+            self.update_status(f"Region {region_id + 1} removed ({len(self.regions)} regions)")
+
+    def clear_regions(self):
+        for region_id in list(self.regions):
+            self.delete_region(region_id)
+        self.next_region_id = 0
+
+    def export_regions(self):
+        """Write every region (and the selection, if it is not a region yet) to files in a folder"""
+        if self.mapping is None:
+            return
+        outputs = [(f"region{region_id + 1:02d}", box) for region_id, box in sorted(self.regions.items())]
+        if None not in (self.start_x, self.start_y, self.end_x, self.end_y):
+            selection = self.mapping.selection_to_source(self.start_x, self.start_y, self.end_x, self.end_y)
+            if selection[2] > selection[0] and selection[3] > selection[1] and selection not in self.regions.values():
+                outputs.append(("selection", selection))
+        if not outputs:
+            self.update_status("No regions to export")
+            return
+        folder = filedialog.askdirectory(title="Folder for the regions")
+        if not folder:
+            return
+
+        stem, extension = os.path.splitext(os.path.basename(self.processor.current_image_path))
+        if extension.lower() not in IMAGE_EXTENSIONS:
+            extension = ".png"
+        outputs = [(os.path.join(folder, f"{stem}_{name}{extension}"), box) for name, box in outputs]
+        processor = self.processor
+
+        def export():
+            with self.profiler.stage("crop_source"):
+                crop = processor.region_reader() # One decode for all regions (or reads from the tiles)
+
+            def write(output):
+                path, box = output
+                Image.fromarray(crop(*box)).save(path)
+
+            # The encoders release the GIL, so the regions are written in parallel
+            with self.profiler.stage("encode"):
+                with ThreadPoolExecutor(max_workers=min(len(outputs), os.cpu_count() or 1)) as executor:
+                    list(executor.map(write, outputs))
+            return len(outputs)
+
+        self.tasks.submit("export_regions", f"Exporting {len(outputs)} regions", export,
+                          lambda count, elapsed: self.update_status(f"{count} regions saved to {folder} ({elapsed:.2f}s)"),
+                          self.on_save_failed)
+
+    """
+    This function saves the cropped image to the file chosen in the save dialog. 
+    It first checks to see if a selection exists or not. The selection on the canvas is drawn on the
+    small (resized) copy of the image, so it is mapped back to source pixels with the display mapping
+    and the crop is cut from the full resolution image only when the user saves.
     And at the end, a success message with the cropped image file path is displayed
     """
     def download_cropped_image(self):
-        if self.cropped_image is not None: # Check if cropped image exists
-            file_path = filedialog.asksaveasfilename(
-                defaultextension=".png",
-                filetypes=[
-                    ("PNG files", "*.png"),
-                    ("JPEG files", "*.jpg"),
-                    ("All files", "*.*")
-                ]
-            )
+        if self.cropped_image is None or self.mapping is None: # Check if cropped image exists
+            return
+
+        # Without jpegtran a JPEG crop would be re-encoded anyway, so PNG stays the default
+        lossless_source = self.lossless_jpeg and self.processor.current_image_path.lower().endswith((".jpg", ".jpeg"))
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".jpg" if lossless_source else ".png",
+            filetypes=[
+                ("PNG files", "*.png"),
+                ("JPEG files", "*.jpg"),
+                ("All files", "*.*")
+            ]
+        )
     
         if file_path:
-            try:
-                cropped_pil_image = Image.fromarray(self.cropped_image)
-                cropped_pil_image.save(file_path)
-                self.update_status(f"Image saved successfully to: {file_path}")
-            except Exception as e:
-                self.update_status(f"Error saving image: {str(e)}")
-                messagebox.showerror("Error", f"Failed to save image: {str(e)}")
+            # Map the canvas selection back to the source image and crop at full resolution
+            x1, y1, x2, y2 = self.mapping.selection_to_source(self.start_x, self.start_y, self.end_x, self.end_y)
+            if x2 <= x1 or y2 <= y1:
+                self.on_save_failed(ValueError("Selection is outside the image"))
+                return
+            processor = self.processor
+
+            # A JPEG saved as JPEG keeps its DCT data (no re-encoding), re-encoding is only done when confirmed
+            lossless = lossless_source and file_path.lower().endswith((".jpg", ".jpeg"))
+            if lossless:
+                try:
+                    plan_lossless_jpeg_crop(processor.current_image_path, (x1, y1, x2, y2))
+                except (OSError, ValueError) as e:
+                    if not messagebox.askyesno("Save Crop", f"The crop cannot be saved losslessly: {str(e)}\n"
+                                                            "Re-encode it instead (some quality is lost)?"):
+                        return
+                    lossless = False
+
+            def save_lossless():
+                with self.profiler.stage("encode"):
+                    snapped = lossless_jpeg_crop(processor.current_image_path, file_path, (x1, y1, x2, y2))
+                return file_path, snapped
+
+            def on_saved_lossless(result, elapsed):
+                path, snapped = result
+                moved = "" if snapped[:2] == (x1, y1) else f", corner moved to {snapped[0]},{snapped[1]} for the JPEG block grid"
+                self.update_status(f"Image saved losslessly to: {path} ({elapsed:.2f}s{moved})")
+
+            if lossless:
+                self.tasks.submit(f"save:{file_path}", f"Saving {os.path.basename(file_path)}", save_lossless,
+                                  on_saved_lossless, self.on_save_failed)
+                return
+
+            def encode():
+                # Decoding the full image (when only a preview is loaded) and encoding run in the background
+                with self.profiler.stage("crop_source"):
+                    cropped_pil_image = Image.fromarray(processor.crop_from_source(x1, y1, x2, y2))
+                with self.profiler.stage("encode"):
+                    cropped_pil_image.save(file_path)
+                return file_path
+
+            self.tasks.submit(f"save:{file_path}", f"Saving {os.path.basename(file_path)}", encode,
+                              lambda path, elapsed: self.update_status(f"Image saved successfully to: {path} ({elapsed:.2f}s)"),
+                              self.on_save_failed)
+
+    def save_renditions(self):
+        """Save the crop at several widths and formats, all from one decode of the source"""
+        if self.cropped_image is None or self.mapping is None:
+            return
+        x1, y1, x2, y2 = self.mapping.selection_to_source(self.start_x, self.start_y, self.end_x, self.end_y)
+        if x2 <= x1 or y2 <= y1:
+            self.on_save_failed(ValueError("Selection is outside the image"))
+            return
+        widths_text = simpledialog.askstring("Save Sizes", "Widths in pixels (full = the whole crop):",
+                                             initialvalue=self.rendition_widths, parent=self.root)
+        if not widths_text:
+            return
+        formats_text = simpledialog.askstring("Save Sizes", "Formats:", initialvalue=self.rendition_formats, parent=self.root)
+        if not formats_text:
+            return
+        try:
+            widths, formats = parse_widths(widths_text), parse_formats(formats_text)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        self.rendition_widths, self.rendition_formats = widths_text, formats_text
+
+        # The files are named <name>_<width>w.<format> next to the chosen name
+        file_path = filedialog.asksaveasfilename(title="Base name for the sizes")
+        if not file_path:
+            return
+        output_stem = os.path.splitext(file_path)[0]
+        processor = self.processor
+
+        def export():
+            with self.profiler.stage("crop_source"):
+                crop = processor.crop_from_source(x1, y1, x2, y2)
+            with self.profiler.stage("encode"):
+                return export_renditions(crop, output_stem, widths, formats)
+
+        self.tasks.submit(f"save:{output_stem}", f"Saving {len(widths) * len(formats)} sizes", export,
+                          lambda paths, elapsed: self.update_status(f"{len(paths)} files saved as {output_stem}_* ({elapsed:.2f}s)"),
+                          self.on_save_failed)
+
+    def on_save_failed(self, error):
+        self.update_status(f"Error saving image: {str(error)}")
+        messagebox.showerror("Error", f"Failed to save image: {str(error)}")
+
+    """
+    Crop templates: the selection is saved as a named template (see make_template) and applied to
+    many images at once in the background (see apply_template).
+    """
+    def save_selection_template(self):
+        """Save the current selection as a named template"""
+        if self.mapping is None or None in (self.start_x, self.start_y, self.end_x, self.end_y):
+            self.update_status("Select a region before saving a template")
+            return
+        box = self.mapping.selection_to_source(self.start_x, self.start_y, self.end_x, self.end_y)
+        if box[2] <= box[0] or box[3] <= box[1]:
+            self.update_status("Selection is outside the image")
+            return
+        name = simpledialog.askstring("Save Template", "Template name:", parent=self.root)
+        if not name or not name.strip():
+            return
+        anchored = messagebox.askyesno(
+            "Save Template",
+            "Keep the crop size in pixels, anchored to the nearest corner, edge or centre?\n"
+            "Choose No to scale the crop with the image size.")
+        template = make_template(box, self.mapping.source_width, self.mapping.source_height,
+                                 "anchored" if anchored else "relative")
+        try:
+            save_template(name.strip(), template)
+            self.update_status(f"Template '{name.strip()}' saved")
+        except OSError as e:
+            self.update_status(f"Error saving template: {str(e)}")
+            messagebox.showerror("Error", f"Failed to save template: {str(e)}")
+
+    def apply_template_to_files(self):
+        """Ask for a template, the images and an output folder, then crop them in the background"""
+        templates = load_templates()
+        if not templates:
+            self.update_status("No templates saved yet")
+            return
+        name = simpledialog.askstring("Apply Template", f"Template ({', '.join(sorted(templates))}):",
+                                      initialvalue=sorted(templates)[0], parent=self.root)
+        if not name:
+            return
+        if name not in templates:
+            messagebox.showerror("Error", f"Unknown template '{name}'")
+            return
+        paths = filedialog.askopenfilenames(
+            filetypes=[("Image files", " ".join(f"*{extension}" for extension in IMAGE_EXTENSIONS)), ("All files", "*.*")])
+        if not paths:
+            return
+        output_dir = filedialog.askdirectory(title="Folder for the cropped images")
+        if not output_dir:
+            return
+
+        template = templates[name]
+        jobs = [(path, os.path.join(output_dir, os.path.basename(path))) for path in paths]
+
+        def crop_all():
+            return [(source, error) for source, _, error in apply_template(template, jobs) if error]
+
+        def on_done(failed, elapsed):
+            self.update_status(f"Template '{name}' applied to {len(jobs) - len(failed)}/{len(jobs)} images in {elapsed:.2f}s")
+            if failed:
+                details = "\n".join(f"{os.path.basename(source)}: {error}" for source, error in failed[:10])
+                messagebox.showerror("Error", f"{len(failed)} images could not be cropped:\n{details}")
+
+        self.tasks.submit("template", f"Applying template '{name}' to {len(jobs)} images", crop_all, on_done,
+                          lambda error: self.update_status(f"Error applying template: {str(error)}"))
             
 
     """
     Implements undo/redo functionality for image selections.
 
-    This section maintains two stacks to track selection states:
-    - undo_stack: Stores previous selection coordinates
-    - redo_stack: Stores undone selections for potential redo
-
-    Each state contains the coordinates (start_x, start_y, end_x, end_y) 
-    of the selection rectangle. The system automatically updates button
-    states based on stack availability.
+    The steps are kept in a SelectionHistory: a bounded ring buffer of (x1, y1, x2, y2)
+    rows in source pixels, so a step can be restored after the view was zoomed or panned.
+    Dragging the same handle several times in a row only makes one step. The history is
+    journaled to disk for each image, so it comes back when the image is opened again
+    (Ctrl+R reopens the image of the last session after a crash).
+    The system automatically updates button states based on the history.
     """
+
+    def selection_state(self):
+        """Return the current selection as a state (in source pixels), EMPTY without a selection"""
+        selection = self.selection_in_source()
+        if selection is None:
+            return SelectionHistory.EMPTY
+        x1, y1, x2, y2 = (int(round(value)) for value in selection)
+        return (x1, y1, x2, y2)
     
     def redo_state(self,event=None):
         """Redo the previously undone action"""
-        if len(self.redo_stack) > 0:
-            # Save current state to undo stack
-            current_state = {
-                "start_x": self.start_x, # Save current coordinates
-                "start_y": self.start_y,
-                "end_x": self.end_x,
-                "end_y": self.end_y
-            }
-            self.undo_stack.append(current_state)
-            
-            # Restore state from redo stack
-            next_state = self.redo_stack.pop()
+        next_state = self.history.redo()
+        if next_state is not None:
             self.restore_state(next_state)
-            
-            # Update button states
-            if len(self.redo_stack) == 0:
-                self.redo_button.config(state=tk.DISABLED)
-            self.undo_button.config(state=tk.NORMAL)
+        self.update_history_buttons()
             
     def restore_state(self, state):
         """Helper method to restore a state and update the display"""
-        if state:
-            # Clear canvas first
-            self.canvas.delete("all")
-            
-            # Restore coordinates that were saved
-            self.start_x = state["start_x"]
-            self.start_y = state["start_y"]
-            self.end_x = state["end_x"]
-            self.end_y = state["end_y"]
-            
-            # Redisplay the original image
-            if self.processed_image is not None:
-                print("Redisplaying original image")  # Debug print
-                image = Image.fromarray(self.processed_image)
-                self.photo_image = ImageTk.PhotoImage(image)
-                self.canvas.create_image(0, 0, image=self.photo_image, anchor=tk.NW)
-            
-            # Apply the mask and redraw the rectangle
-            self.apply_selection_mask()
+        if state is None or self.mapping is None:
+            return
+        if state == SelectionHistory.EMPTY:
+            # Back to no selection
+            self.start_x = self.start_y = self.end_x = self.end_y = None
+            self.cropped_image = None
+            self.compositor.clear_selection()
             self.redraw_rectangle()
+            self.download_button.config(state=tk.DISABLED)
+            self.renditions_button.config(state=tk.DISABLED)
+            self.update_status("Selection cleared")
+            return
+
+        # Restore coordinates that were saved (mapped to the current view)
+        self.set_selection_from_source(state)
+        
+        # Apply the mask and redraw the rectangle (the displayed image is reused, only the clear area changes)
+        self.apply_selection_mask()
+        self.redraw_rectangle()
+        
+        # Update status
+        x1, y1, x2, y2 = state
+        self.update_status(f"Selection area: {abs(x2-x1)}x{abs(y2-y1)} pixels")
             
-            # Update status
-            x1, x2 = sorted([self.start_x, self.end_x])
-            y1, y2 = sorted([self.start_y, self.end_y])
-            self.update_status(f"Selection area: {x2-x1}x{y2-y1} pixels")
-            
-    def save_state(self):
-        """Save current selection state to undo stack"""
-        if None not in (self.start_x, self.start_y, self.end_x, self.end_y):
-            
-            # Store current coordinates
-            state = {
-                "start_x": self.start_x,
-                "start_y": self.start_y,
-                "end_x": self.end_x,
-                "end_y": self.end_y
-            }
-            
-            self.undo_stack.append(state)
-            self.redo_stack.clear() # Clear redo history on new action
-            
-            # Enable/disable undo/redo buttons based on current stack state
-            self.undo_button.config(state=tk.NORMAL)
-            self.redo_button.config(state=tk.DISABLED)
+    def suggest_crop(self):
+        """Select the suggested crop (flat borders trimmed, detailed area kept) as a new undo step"""
+        if self.mapping is None:
+            self.update_status("Load an image before asking for a crop suggestion")
+            return
+        # Keep the shape of the current selection, without one the trimmed image decides
+        aspect = None
+        selection = self.selection_in_source()
+        if selection is not None and selection[2] != selection[0] and selection[3] != selection[1]:
+            aspect = abs(selection[2] - selection[0]) / abs(selection[3] - selection[1])
+        started = time.perf_counter()
+        with self.profiler.stage("suggest_crop"):
+            box = suggest_source_crop(self.processor, aspect) # Analyses a small copy of the loaded preview
+        elapsed = (time.perf_counter() - started) * 1000
+        self.restore_state(box)
+        self.save_state()
+        self.update_status(f"Suggested crop: {box[2] - box[0]}x{box[3] - box[1]} pixels ({elapsed:.0f} ms)")
+
+    def save_state(self, handle=None):
+        """Save current selection state to the history, repeated drags of the same handle merge into one step"""
+        if self.mapping is not None and None not in (self.start_x, self.start_y, self.end_x, self.end_y):
+            self.history.push(self.selection_state(), merge_key=handle)
+            self.update_history_buttons()
             
     def undo_state(self, event=None):
         """Undo the last action and revers to the previous state"""
-        if len(self.undo_stack) > 0:
-            # Save current state to redo stack
-            current_state = {
-                "start_x": self.start_x,
-                "start_y": self.start_y,
-                "end_x": self.end_x,
-                "end_y": self.end_y
-            }
-            self.redo_stack.append(current_state)
-            
-            # Restore previous state
-            previous_state = self.undo_stack.pop()
-            
+        previous_state = self.history.undo()
+        if previous_state is not None:
             # Used the restore_state helper
             self.restore_state(previous_state)
-            
-            # Update button states
-            if len(self.undo_stack) == 0:
-                self.undo_button.config(state=tk.DISABLED)
-            self.redo_button.config(state=tk.NORMAL)
-            print(f"Undo stack after: {len(self.undo_stack)}")
+        self.update_history_buttons()
+
+    def update_history_buttons(self):
+        """Enable/disable undo/redo buttons based on the history"""
+        self.undo_button.config(state=tk.NORMAL if self.history.can_undo() else tk.DISABLED)
+        self.redo_button.config(state=tk.NORMAL if self.history.can_redo() else tk.DISABLED)
+
+    def open_history(self, image_path):
+        """Load the journaled history of an image and restore its last selection"""
+        try:
+            self.history.open_journal(SelectionHistory.journal_path_for(image_path))
+            os.makedirs(os.path.dirname(self.last_session_path), exist_ok=True)
+            with open(self.last_session_path, "w") as session_file:
+                session_file.write(image_path)
+        except OSError as e:
+            # No journal (read only home folder etc.), the history still works in memory
+            print(f"Error: {str(e)}")
+            self.history.close_journal()
+            self.history.reset()
+        if self.history.current() is None:
+            self.history.push(SelectionHistory.EMPTY) # Base step, undo goes back to no selection
+        else:
+            self.restore_state(self.history.current())
+        self.update_history_buttons()
+
+    def restore_last_session(self):
+        """Reopen the image of the last session, its history and selection come back from the journal"""
+        try:
+            with open(self.last_session_path) as session_file:
+                image_path = session_file.read().strip()
+        except OSError:
+            image_path = ""
+        if image_path and os.path.exists(image_path):
+            self.open_image(image_path)
+        else:
+            self.update_status("No previous session to restore")
 
     
 def main():
@@ -585,8 +2143,13 @@ def main():
     root = tk.Tk() #create the main application window 
     root.geometry("1024x768")  # Set the window size, can be changed to other values (optional)
     app = LoadingImage(root) #starts the application with root window
+    # OpenCV, NumPy and PIL load on a thread once the window is shown, so they do not delay the first paint
+    root.after_idle(lambda: threading.Thread(target=preload_modules, daemon=True).start())
     root.mainloop()    # Start the Tkinter event loop
 
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        # Headless batch cropping, crop templates and the local crop service, no window is created
+        sys.exit(COMMANDS[sys.argv[1]](sys.argv[2:]))
     main()
\ No newline at end of file